@@ -0,0 +1,91 @@
+"""
+Benchmark downloading a search from a local stand-in for allelefrequencies.net.
+
+Times `HLAfreq.getAFdata()` serially, concurrently, and from a warm cache
+against `tests/fakeserver.py`, reporting pages per second and the time to
+download the whole search. Run from the repository root:
+
+```
+python benchmarks/download.py --pages 50 --latency 0.05 --workers 8
+```
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import HLAfreq
+from HLAfreq import HLAfreq_cache, HLAfreq_session
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+from fakeserver import FakeAFServer  # noqa: E402
+
+
+def timeit(function, repeat):
+    """Best time of `repeat` calls of `function`"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(pages=20, latency=0.02, error_rate=0, workers=8, repeat=3):
+    """Time downloading a search in each download mode.
+
+    Args:
+        pages (int, optional): Number of pages of results. Defaults to 20.
+        latency (float, optional): Server latency in seconds. Defaults to 0.02.
+        error_rate (float, optional): Fraction of requests that fail and are
+            retried. Defaults to 0.
+        workers (int, optional): Concurrent downloads. Defaults to 8.
+        repeat (int, optional): Number of times to repeat each mode, the best
+            time is reported. Defaults to 3.
+
+    Returns:
+        dict: Mode to time in seconds to download all pages.
+    """
+    session = HLAfreq_session.AFSession(retries=10, backoff_factor=0, pool_size=workers)
+    results = {}
+    with FakeAFServer(npages=pages, latency=latency, error_rate=error_rate) as server:
+        base_url = server.makeURL(locus="A")
+
+        def download(**kwargs):
+            with open(os.devnull, "w") as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    HLAfreq.getAFdata(base_url, session=session, **kwargs)
+                finally:
+                    sys.stdout = stdout
+
+        results["serial"] = timeit(lambda: download(cache=False), repeat)
+        results["concurrent"] = timeit(
+            lambda: download(workers=workers, cache=False), repeat
+        )
+        with tempfile.TemporaryDirectory() as path:
+            cache = HLAfreq_cache.ResponseCache(path)
+            download(cache=cache)
+            results["cached"] = timeit(lambda: download(cache=cache), repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    results = benchmark(
+        args.pages, args.latency, args.error_rate, args.workers, args.repeat
+    )
+    print("%-12s %10s %10s" % ("mode", "seconds", "pages/sec"))
+    for mode, seconds in results.items():
+        print("%-12s %10.3f %10.1f" % (mode, seconds, args.pages / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -38,16 +38,17 @@ countries = regions.Country.tolist()
 
 # Download A and B data for all countries to identify 
 # Countries poorly covered by the IEDB reference set
-for locus in ['A', 'B']:
-    # for country in ['Indonesia', 'Philippines']:
-    for country in countries:
-        print(country)
-        try:
-            base_url = HLAfreq.makeURL(country, standard='s', locus=locus)
-            aftab = HLAfreq.getAFdata(base_url)
-            aftab.to_csv(f"data/example/population_coverage/{country}_{locus}_raw.csv", index=False)
-        except:
-            pass
+# All pages of all queries are downloaded by one pool of workers
+queries = {
+    (country, locus): {'country': country, 'standard': 's', 'locus': locus}
+    for locus in ['A', 'B']
+    for country in countries
+}
+aftabs, status = HLAfreq.getAFbatch(queries, workers=8)
+for (country, locus), aftab in aftabs.items():
+    aftab.to_csv(f"data/example/population_coverage/{country}_{locus}_raw.csv", index=False)
+# Countries without data for a locus fail and are skipped
+print(status[status.status == 'failed'])
 
 
 iedb_cov = []
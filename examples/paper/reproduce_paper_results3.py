@@ -14,6 +14,7 @@ Takes ~30 minutes to download data
 import os
 import requests
 import HLAfreq as HLAfreq
+from HLAfreq import HLAfreq_matrix
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -100,31 +101,17 @@ cafs.append(cafSP)
 
 cafs = pd.concat(cafs, axis=0).reset_index(drop=True)
 
-# Give record for all alleles to all countries
-cafs = HLAfreq.unmeasured_alleles(cafs, 'country')
-
-# Check all countries have the same number of alleles
-cafs.groupby('country').allele.unique().apply(len).unique()
-
-# Sort by allele then select a single country,
-# check that its alleles match a specified list
-# then use the frequencies as features
-cafs = cafs.sort_values('allele')
-
-sorted_alleles = sorted(list(cafs.allele.unique()))
-
-AFeatures = []
-for country in cafs.country.unique():
-    mask = cafs['country'] == country
-    # Only generate features for countries with records
-    # e.g. Thailand has no loci A records
-    if any(mask):
-        assert all(cafs[mask].allele.unique() == sorted_alleles)
-        features = [country] + cafs[mask].allele_freq.tolist()
-        AFeatures.append(features)
+# Countries by alleles, giving record for all alleles to all countries
+# Only countries with records get features
+# e.g. Thailand has no loci A records
+AFeatures = (
+    HLAfreq_matrix.AFMatrix.from_long(cafs, datasetID='country', format=False)
+    .fill_unmeasured()
+    .to_frame()
+)
 
 # Dataframe of allele frequencies read for dimension reduction
-AFeatures = pd.DataFrame(AFeatures, columns = ['country'] + sorted_alleles)
+AFeatures = AFeatures.rename_axis('country').reset_index()
 AFeatures.to_csv("data/example/globalPCA/AF_features.csv", index=False)
 
 ###################
@@ -23,6 +23,10 @@ setup(
         'pymc>=3',
         'arviz'
     ],
+    extras_require={
+        'snapshot': ['pyarrow'],
+        'async': ['aiohttp'],
+    },
     classifiers=[
     "Programming Language :: Python :: 3",
     "Operating System :: OS Independent",
@@ -8,7 +8,8 @@ estimate HLA frequencies of countries or other regions such as
 global HLA frequencies.
 """
 
-from bs4 import BeautifulSoup
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import requests
 import pandas as pd
 import numpy as np
@@ -16,6 +17,8 @@ import matplotlib.pyplot as plt
 import math
 import scipy as sp
 import matplotlib.colors as mcolors
+from HLAfreq import HLAfreq_session, HLAfreq_cache, HLAfreq_parse, HLAfreq_allele
+from HLAfreq import HLAfreq_validate, HLAfreq_matrix
 
 
 def makeURL(
@@ -111,38 +114,68 @@ def makeURL(
     return url
 
 
+_AF_COLUMNS = [
+    "line",
+    "allele",
+    "flag",
+    "population",
+    "carriers%",
+    "allele_freq",
+    "AF_graphic",
+    "sample_size",
+    "database",
+    "distribution",
+    "haplotype_association",
+    "notes",
+]
+
+
 def parseAF(bs):
     """Generate a dataframe from a given html page
 
+    Page text is parsed with the fast extractor in `HLAfreq_parse`, which only
+    reads the results table. A BeautifulSoup object is parsed by walking the
+    full tree, both give the same table.
+
     Args:
-        bs (bs4.BeautifulSoup): BeautifulSoup object from allelefrequencies.net page
+        bs (str or bs4.BeautifulSoup): html text of, or BeautifulSoup object from,
+            allelefrequencies.net page
 
     Returns:
         pd.DataFrame: Table of allele, allele frequency, samplesize, and population
     """
+    if isinstance(bs, str):
+        # skip the first row as it's `th` headers
+        rows = HLAfreq_parse.AF_rows(bs)[1:]
+        for row in rows:
+            if not len(row) == len(_AF_COLUMNS):
+                raise ValueError(
+                    "%s columns passed, passed data had %s columns"
+                    % (len(_AF_COLUMNS), len(row))
+                )
+        # Build only the wanted columns
+        columns = dict(zip(_AF_COLUMNS, zip(*rows))) if rows else {}
+        allele = pd.Series(columns.get("allele", []), dtype=object)
+        df = pd.DataFrame(
+            {
+                "allele": allele.tolist(),
+                "loci": HLAfreq_allele.loci(allele).tolist(),
+                "population": list(columns.get("population", [])),
+                "allele_freq": list(columns.get("allele_freq", [])),
+                "carriers%": list(columns.get("carriers%", [])),
+                "sample_size": list(columns.get("sample_size", [])),
+            },
+            dtype=object,
+        )
+        return df
     # Get the results table from the div `divGenDetail`
     tab = bs.find("div", {"id": "divGenDetail"}).find("table", {"class": "tblNormal"})
-    # Get the column headers from the first row of the table
-    columns = [
-        "line",
-        "allele",
-        "flag",
-        "population",
-        "carriers%",
-        "allele_freq",
-        "AF_graphic",
-        "sample_size",
-        "database",
-        "distribution",
-        "haplotype_association",
-        "notes",
-    ]
     rows = []
     for row in tab.find_all("tr"):
         rows.append([td.get_text(strip=True) for td in row.find_all("td")])
     # Make dataframe of table rows
     # skip the first row as it's `th` headers
-    df = pd.DataFrame(rows[1:], columns=columns)
+    df = pd.DataFrame(rows[1:], columns=_AF_COLUMNS)
 
     # Get HLA loci
     df["loci"] = df.allele.apply(lambda x: x.split("*")[0])
@@ -156,11 +189,14 @@ def Npages(bs):
     """How many pages of results are there?
 
     Args:
-        bs (bs4.BeautifulSoup): BS object of allelefrequencies.net results page
+        bs (str or bs4.BeautifulSoup): html text of, or BS object from,
+            allelefrequencies.net results page
 
     Returns:
         int: Total number of results pages
     """
+    if isinstance(bs, str):
+        return HLAfreq_parse.page_count(bs)
     # Get the table with number of pages
     navtab = bs.find("div", {"id": "divGenNavig"}).find("table", {"class": "table10"})
     if not navtab:
@@ -178,7 +214,7 @@ def Npages(bs):
     return N
 
 
-def formatAF(AFtab, ignoreG=True):
+def formatAF(AFtab, ignoreG=True, inplace=False):
     """Format allele frequency table.
 
     Convert sample_size and allele_freq to numeric data type.
@@ -186,71 +222,505 @@ def formatAF(AFtab, ignoreG=True):
     `ignoreG` is `True`. `formatAF()` is used internally by combineAF and getAFdata
     by default.
 
+    A table whose sample_size and allele_freq are already numeric, see
+    `is_formatted()`, is returned as it is, without copying.
+
     Args:
         AFtab (pd.DataFrame): Allele frequency data downloaded from allelefrequency.net
             using `getAFdata()`.
         ignoreG (bool, optional): Treat G group alleles as normal.
             See http://hla.alleles.org/alleles/g_groups.html for details. Defaults to True.
+        inplace (bool, optional): Format `AFtab` itself rather than a copy.
+            Defaults to False.
 
     Returns:
         pd.DataFrame: The formatted allele frequency data.
     """
-    df = AFtab.copy()
-    if df.sample_size.dtype == "O":
-        df.sample_size = pd.to_numeric(df.sample_size.str.replace(",", ""))
-    if df.allele_freq.dtype == "O":
-        if ignoreG:
-            df.allele_freq = df.allele_freq.str.replace("(*)", "", regex=False)
-        df.allele_freq = pd.to_numeric(df.allele_freq)
+    if is_formatted(AFtab):
+        return AFtab
+    df = AFtab if inplace else AFtab.copy()
+    if not pd.api.types.is_numeric_dtype(df.sample_size):
+        df["sample_size"] = _to_numeric(df.sample_size, ",")
+    if not pd.api.types.is_numeric_dtype(df.allele_freq):
+        df["allele_freq"] = _to_numeric(df.allele_freq, "(*)" if ignoreG else None)
     return df
 
 
-def getAFdata(base_url, timeout=20, format=True, ignoreG=True):
-    """Get all allele frequency data from a search base_url.
+def _to_numeric(values, remove=None):
+    """Convert text to numbers, removing the substring `remove` first"""
+    if remove is not None:
+        values = values.str.replace(remove, "", regex=False)
+    return pd.to_numeric(values)
 
-    Iterates over all pages regardless of which page is based.
+
+def is_formatted(AFtab):
+    """Has allele frequency data been formatted by `formatAF()`?
 
     Args:
-        base_url (str): URL for base search.
+        AFtab (pd.DataFrame): Allele frequency data.
+
+    Returns:
+        bool: True if sample_size and allele_freq are numeric.
+    """
+    return pd.api.types.is_numeric_dtype(
+        AFtab.sample_size
+    ) and pd.api.types.is_numeric_dtype(AFtab.allele_freq)
+
+
+def compactAF(AFtab, ignoreG=True):
+    """Convert allele frequency data to compact data types.
+
+    `allele`, `loci`, and `population` become categoricals, `allele_freq` and
+    `carriers%` float32, and `sample_size` int32. Data is formatted with
+    `formatAF()` first. Compact data uses several times less memory and
+    grouping is faster. `only_complete()`, `decrease_resolution()`,
+    `unmeasured_alleles()`, and `combineAF()` keep these data types.
+
+    Args:
+        AFtab (pd.DataFrame): Allele frequency data.
+        ignoreG (bool, optional): Treat G group alleles as normal, see `formatAF()`.
+            Defaults to True.
+
+    Returns:
+        pd.DataFrame: Allele frequency data with compact data types.
+    """
+    df = formatAF(AFtab.copy(), ignoreG, inplace=True)
+    for column in ["allele", "loci", "population"]:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    df["allele_freq"] = df.allele_freq.astype("float32")
+    df["sample_size"] = df.sample_size.astype("int32")
+    if "carriers%" in df.columns:
+        df["carriers%"] = pd.to_numeric(df["carriers%"], errors="coerce").astype("float32")
+    return df
+
+
+def _match_dtypes(df, AFtab):
+    """Give columns of `df` the compact data types they have in `AFtab`.
+
+    Used so that functions given `compactAF()` data return compact data.
+    """
+    for column in df.columns.intersection(AFtab.columns):
+        dtype = AFtab[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype("category")
+        elif dtype in (np.float32, np.int32) and not df[column].dtype == dtype:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def _getPageText(url, timeout=20, session=None, cache=None):
+    """Download the text of a single allelefrequencies.net results page.
+
+    Args:
+        url (str): URL of the results page.
         timeout (int): How long to wait to receive a response.
-        format (bool): Format the downloaded data using `formatAF()`.
-        ignoreG (bool): treat allele G groups as normal.
-            See http://hla.alleles.org/alleles/g_groups.html for details. Default = True
+        session (requests.Session, optional): Session to download with,
+            see `HLAfreq_session`. Defaults to the shared session.
+        cache (HLAfreq_cache.ResponseCache, optional): Cache to read the page
+            from and store it in. Defaults to the default cache, see
+            `HLAfreq_cache.set_cache()`. Set False to not use a cache.
 
     Returns:
-        pd.DataFrame: allele frequency data parsed into a pandas dataframe
+        str: Text of the results page
     """
-    # Get BS object from base search
+    if cache is None:
+        cache = HLAfreq_cache.get_cache()
+    if cache:
+        text = cache.get(url)
+        if text is not None:
+            return text
+        if cache.offline:
+            raise Exception("Page is not in the offline cache %s: %s" % (cache.path, url))
     try:
-        bs = BeautifulSoup(requests.get(base_url, timeout=timeout).text, "html.parser")
-    except requests.exceptions.ReadTimeout as e:
+        text = HLAfreq_session.get(url, timeout=timeout, session=session).text
+    except requests.exceptions.Timeout as e:
         raise Exception("Requests timeout, try a larger `timeout` value for `getAFdata()`") from e
+    except (requests.exceptions.ConnectionError, requests.exceptions.RetryError) as e:
+        raise Exception(
+            "Request failed after retries, try a larger `timeout` value for `getAFdata()`"
+            " or more retries with `HLAfreq_session.configure_session()`"
+        ) from e
+    if cache:
+        cache.set(url, text)
+    return text
+
+
+def _getPageAF(url, timeout=20, session=None, cache=None, checkpoint=None, page=None):
+    """Download a single results page and parse the allele frequency table.
+
+    If `checkpoint` is given, `page` is loaded from it if saved, otherwise
+    it is downloaded and saved.
+    """
+    if checkpoint is not None and page in checkpoint:
+        return checkpoint.load(page)
+    tab = parseAF(_getPageText(url, timeout, session, cache))
+    if checkpoint is not None:
+        checkpoint.save(page, tab)
+    return tab
+
+
+def iterAFdata(
+    base_url,
+    timeout=20,
+    format=True,
+    ignoreG=True,
+    workers=1,
+    session=None,
+    cache=None,
+    checkpoint=None,
+):
+    """Iterate over the pages of allele frequency data from a search base_url.
+
+    Yields each page as soon as it is downloaded and parsed, in page order, so
+    that only `workers` pages are held in memory at once and processing can
+    start before the download finishes. See `writeAFdata()` to save pages to
+    a file as they arrive.
+
+    Args:
+        base_url (str): URL for base search.
+        timeout (int): How long to wait to receive a response.
+        format (bool): Format each page using `formatAF()`.
+        ignoreG (bool): treat allele G groups as normal.
+            See http://hla.alleles.org/alleles/g_groups.html for details. Default = True
+        workers (int): Number of pages to download at once. Defaults to 1,
+            download pages one after another.
+        session (requests.Session, optional): Session to download with. Defaults
+            to the shared session which retries failed pages, see `HLAfreq_session`.
+        cache (HLAfreq_cache.ResponseCache): On disk cache of downloaded pages.
+            Defaults to the cache set with `HLAfreq_cache.set_cache()`, if any.
+            Set False to download every page even if a default cache is set.
+        checkpoint (str, optional): Directory to save each page to as it is
+            downloaded. If a download fails, rerunning it with the same `checkpoint`
+            only downloads the missing pages. Saved pages are removed once every
+            page is downloaded. Defaults to None, no checkpoint.
+
+    Yields:
+        pd.DataFrame: allele frequency data of a single page
+    """
+    if workers < 1:
+        raise AssertionError("workers must be at least 1, not %s" % workers)
+    # Get page text from base search
+    text = _getPageText(base_url, timeout, session, cache)
     # How many pages of results
-    N = Npages(bs)
+    N = Npages(text)
     print("%s pages of results" % N)
-    # iterate over pages, parse and combine data from each
-    tabs = []
-    for i in range(N):
-        # print (" Parsing page %s" %(i+1))
-        print(" Parsing page %s" % (i + 1), end="\r")
-        url = base_url + "page=" + str(i + 1)
-        try:
-            bs = BeautifulSoup(requests.get(url, timeout=timeout).text, "html.parser")
-        except requests.exceptions.ReadTimeout as e:
-            raise Exception("Requests timeout, try a larger `timeout` value for `getAFdata()`") from e
-        tab = parseAF(bs)
-        tabs.append(tab)
+    if checkpoint:
+        checkpoint = HLAfreq_cache.PageCheckpoint(checkpoint, base_url, N)
+        print("%s pages already downloaded" % len(checkpoint.pages()))
+    else:
+        checkpoint = None
+    urls = [base_url + "page=" + str(i + 1) for i in range(N)]
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = deque()
+    page = 0
+    try:
+        for i, url in enumerate(urls):
+            futures.append(
+                executor.submit(_getPageAF, url, timeout, session, cache, checkpoint, i + 1)
+            )
+            # Only download up to `workers` pages ahead of the consumer
+            while futures and (len(futures) >= workers or i + 1 == N):
+                page += 1
+                print(" Parsing page %s" % page, end="\r")
+                yield _formatPage(futures.popleft().result(), format, ignoreG)
+    finally:
+        # Don't start any more pages if one has failed or iteration stopped
+        executor.shutdown(wait=True, cancel_futures=True)
+    # Every page delivered, so a later run must download the search again
+    if checkpoint is not None:
+        checkpoint.remove()
     print("Download complete")
-    tabs = pd.concat(tabs)
+
+
+def _concatPages(tabs):
+    """Concatenate parsed pages, a search with no pages gives an empty table"""
+    if not tabs:
+        columns = ["allele", "loci", "population", "allele_freq", "carriers%", "sample_size"]
+        return pd.DataFrame({column: [] for column in columns}, dtype=object)
+    return pd.concat(tabs)
+
+
+def _formatPage(tab, format=True, ignoreG=True):
+    """Format a single page of allele frequency data if `format`"""
     if format:
         try:
-            tabs = formatAF(tabs, ignoreG)
+            tab = formatAF(tab, ignoreG, inplace=True)
         except AttributeError:
             print("Formatting failed, non-numeric datatypes may remain.")
-    return tabs
+    return tab
+
+
+def getAFdata(
+    base_url,
+    timeout=20,
+    format=True,
+    ignoreG=True,
+    workers=1,
+    session=None,
+    cache=None,
+    checkpoint=None,
+    compact=False,
+):
+    """Get all allele frequency data from a search base_url.
+
+    Iterates over all pages regardless of which page is based.
+    If `workers` is greater than 1 pages are downloaded and parsed
+    concurrently, the returned data is in page order either way. A search
+    with no results gives a table with no rows.
+    For very large searches see `iterAFdata()` and `writeAFdata()`
+    which don't hold all pages in memory.
+
+    Args:
+        base_url (str): URL for base search.
+        timeout (int): How long to wait to receive a response.
+        format (bool): Format the downloaded data using `formatAF()`.
+        ignoreG (bool): treat allele G groups as normal.
+            See http://hla.alleles.org/alleles/g_groups.html for details. Default = True
+        workers (int): Number of pages to download at once. Defaults to 1,
+            download pages one after another.
+        session (requests.Session, optional): Session to download with. Defaults
+            to the shared session which retries failed pages, see `HLAfreq_session`.
+        cache (HLAfreq_cache.ResponseCache): On disk cache of downloaded pages.
+            Defaults to the cache set with `HLAfreq_cache.set_cache()`, if any.
+            Set False to download every page even if a default cache is set.
+        checkpoint (str, optional): Directory to save each page to as it is
+            downloaded. If a download fails, rerunning it with the same `checkpoint`
+            only downloads the missing pages. Saved pages are removed once every
+            page is downloaded. Defaults to None, no checkpoint.
+        compact (bool, optional): Return compact data types, see `compactAF()`.
+            Compact data is formatted, so requires `format`. Defaults to False.
+
+    Returns:
+        pd.DataFrame: allele frequency data parsed into a pandas dataframe
+    """
+    if compact and not format:
+        raise AssertionError("compact data is formatted, compact requires format=True")
+    tabs = iterAFdata(
+        base_url,
+        timeout=timeout,
+        format=False,
+        workers=workers,
+        session=session,
+        cache=cache,
+        checkpoint=checkpoint,
+    )
+    tabs = _concatPages(list(tabs))
+    if compact:
+        return compactAF(tabs, ignoreG)
+    return _formatPage(tabs, format, ignoreG)
+
+
+def writeAFdata(base_url, path, format=True, ignoreG=True, **kwargs):
+    """Download allele frequency data from a search base_url straight to a file.
+
+    Each page is appended to the file as soon as it is downloaded, so
+    searches of any size are downloaded in constant memory.
+    Files ending `.parquet` are written with `pyarrow`, anything else is CSV.
+
+    Args:
+        base_url (str): URL for base search.
+        path (str): File to write, overwritten if it exists.
+        format (bool): Format each page using `formatAF()`.
+        ignoreG (bool): treat allele G groups as normal. Default = True
+        **kwargs: Other arguments for `iterAFdata()`, e.g. `workers`.
+
+    Returns:
+        int: Number of rows written.
+    """
+    rows = 0
+    pages = iterAFdata(base_url, format=format, ignoreG=ignoreG, **kwargs)
+    # Written if there are no pages, so the file always has the columns
+    empty = _formatPage(_concatPages([]), format, ignoreG)
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+
+        def write(tab):
+            nonlocal writer
+            if format:
+                # Same schema for every page
+                tab = tab.astype({"allele_freq": "float64", "sample_size": "int64"})
+            table = pa.Table.from_pandas(tab, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
 
+        try:
+            for tab in pages:
+                write(tab)
+                rows += len(tab)
+            if writer is None:
+                write(empty)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(path, "w", newline="") as f:
+            header = True
+            for tab in pages:
+                tab.to_csv(f, index=False, header=header)
+                header = False
+                rows += len(tab)
+            if header:
+                empty.to_csv(f, index=False)
+    return rows
+
+
+def _query_urls(queries):
+    """Dictionary of query name to base URL from a batch of queries.
+
+    Args:
+        queries (dict or list): Queries as base URLs or dictionaries of `makeURL()`
+            arguments. If a dict, keys are used as query names, if a list the
+            position in the list is used.
 
-def incomplete_studies(AFtab, llimit=0.95, ulimit=1.1, datasetID="population"):
+    Returns:
+        dict: Query name to base URL.
+    """
+    if not isinstance(queries, dict):
+        queries = dict(enumerate(queries))
+    urls = {}
+    for name, query in queries.items():
+        if isinstance(query, dict):
+            query = makeURL(**query)
+        urls[name] = query
+    return urls
+
+
+def getAFbatch(
+    queries,
+    workers=4,
+    timeout=20,
+    format=True,
+    ignoreG=True,
+    session=None,
+    cache=None,
+    checkpoint=None,
+    concat=False,
+):
+    """Get allele frequency data for many searches at once.
+
+    Every page of every query is downloaded by one shared pool of `workers`.
+    The first page of each query is requested straight away and its remaining
+    pages are scheduled as soon as the number of pages is known, so the pool
+    stays busy across queries. Requests are rate limited by the session, see
+    `HLAfreq_session.configure_session()`. A failed query does not stop the
+    others, check the returned status.
+
+    ```
+    queries = {
+        (country, locus): {"country": country, "locus": locus}
+        for country in ["Uganda", "Kenya"] for locus in ["A", "B", "C"]
+    }
+    aftabs, status = HLAfreq.getAFbatch(queries)
+    ```
+
+    Args:
+        queries (dict or list): Queries as base URLs or dictionaries of `makeURL()`
+            arguments. If a dict, keys are used as query names, if a list the
+            position in the list is used.
+        workers (int, optional): Number of pages to download at once. Defaults to 4.
+        timeout (int, optional): How long to wait to receive a response.
+            Defaults to 20.
+        format (bool, optional): Format the downloaded data using `formatAF()`.
+            Defaults to True.
+        ignoreG (bool, optional): treat allele G groups as normal. Defaults to True.
+        session (requests.Session, optional): Session to download with. Defaults
+            to the shared session, see `HLAfreq_session`.
+        cache (HLAfreq_cache.ResponseCache, optional): On disk cache of downloaded
+            pages, see `getAFdata()`.
+        checkpoint (str, optional): Directory to save each page to as it is
+            downloaded, rerunning a batch with the same `checkpoint` only downloads
+            missing pages. Saved pages of each query are removed once it is
+            complete. See `getAFdata()`. Defaults to None, no checkpoint.
+        concat (bool, optional): Return a single table with a `query` column
+            rather than a dictionary of tables. Defaults to False.
+
+    Returns:
+        tuple: Allele frequency data, as a dictionary of query name to
+            pd.DataFrame or a single pd.DataFrame if `concat`, and a pd.DataFrame
+            status report with the `url`, number of `pages`, `status` ("complete"
+            or "failed"), and `error` of each query indexed by query name.
+            Failed queries are not in the allele frequency data.
+    """
+    if workers < 1:
+        raise AssertionError("workers must be at least 1, not %s" % workers)
+    urls = _query_urls(queries)
+    status = {
+        name: {"url": url, "pages": None, "status": "pending", "error": ""}
+        for name, url in urls.items()
+    }
+    pages = {name: {} for name in urls}
+    checkpoints = {}
+    print("Downloading %s queries" % len(urls))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Page 0 is the base search, used to get the number of pages
+        pending = {
+            executor.submit(_getPageText, url, timeout, session, cache): (name, 0)
+            for name, url in urls.items()
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, page = pending.pop(future)
+                if status[name]["status"] == "failed":
+                    continue
+                try:
+                    result = future.result()
+                    if page == 0:
+                        N = Npages(result)
+                        status[name]["pages"] = N
+                        query_checkpoint = None
+                        if checkpoint:
+                            query_checkpoint = HLAfreq_cache.PageCheckpoint(
+                                checkpoint, urls[name], N
+                            )
+                            checkpoints[name] = query_checkpoint
+                        for i in range(N):
+                            url = urls[name] + "page=" + str(i + 1)
+                            page_future = executor.submit(
+                                _getPageAF, url, timeout, session, cache, query_checkpoint, i + 1
+                            )
+                            pending[page_future] = (name, i + 1)
+                    else:
+                        pages[name][page] = result
+                except Exception as e:
+                    status[name]["status"] = "failed"
+                    status[name]["error"] = repr(e)
+                    # Don't download the rest of a failed query
+                    for other, (other_name, _) in pending.items():
+                        if other_name == name:
+                            other.cancel()
+    results = {}
+    for name in urls:
+        if status[name]["status"] == "failed":
+            continue
+        tabs = _concatPages([pages[name][i + 1] for i in range(status[name]["pages"])])
+        if format:
+            try:
+                tabs = formatAF(tabs, ignoreG, inplace=True)
+            except AttributeError:
+                print("Formatting failed for %s, non-numeric datatypes may remain." % (name,))
+        results[name] = tabs
+        status[name]["status"] = "complete"
+        if name in checkpoints:
+            checkpoints[name].remove()
+    status = pd.DataFrame.from_dict(status, orient="index")
+    failed = (status.status == "failed").sum()
+    print("Download complete, %s of %s queries failed" % (failed, len(status)))
+    if concat:
+        tabs = [tab.assign(query=[name] * len(tab)) for name, tab in results.items()]
+        results = pd.concat(tabs, ignore_index=True) if tabs else pd.DataFrame()
+    return results, status
+
+
+def incomplete_studies(
+    AFtab, llimit=0.95, ulimit=1.1, datasetID="population", quiet=False
+):
     """Report any studies with allele freqs that don't sum to 1
 
     Args:
@@ -260,21 +730,29 @@ def incomplete_studies(AFtab, llimit=0.95, ulimit=1.1, datasetID="population"):
         ulimit (float, optional): Upper allele_freq sum limit that will not be reported.
             Defaults to 1.1.
         datasetID (str): Unique identifier column for study
+        quiet (bool, optional): Return the report without printing it.
+            Defaults to False.
+
+    Returns:
+        pd.Series: Total allele frequency of each incomplete study, indexed by
+            `datasetID` and `loci`.
     """
-    poplocs = AFtab.groupby([datasetID, "loci"]).allele_freq.sum()
+    poplocs = AFtab.groupby([datasetID, "loci"], observed=True).allele_freq.sum()
     lmask = poplocs < llimit
-    if sum(lmask > 0):
+    if sum(lmask > 0) and not quiet:
         print(poplocs[lmask])
         print(f"{sum(lmask)} studies have total allele frequency < {llimit}")
     umask = poplocs > ulimit
-    if sum(umask > 0):
+    if sum(umask > 0) and not quiet:
         print(poplocs[umask])
         print(f"{sum(umask)} studies have total allele frequency > {ulimit}")
     incomplete = pd.concat([poplocs[lmask], poplocs[umask]])
     return incomplete
 
 
-def only_complete(AFtab, llimit=0.95, ulimit=1.1, datasetID="population"):
+def only_complete(
+    AFtab, llimit=0.95, ulimit=1.1, datasetID="population", quiet=False
+):
     """Returns only complete studies.
 
     Studies are only dropped if their population and loci are in noncomplete together.
@@ -287,20 +765,20 @@ def only_complete(AFtab, llimit=0.95, ulimit=1.1, datasetID="population"):
         ulimit (float, optional): Upper allele_freq sum limit that will not be reported.
             Defaults to 1.1.
         datasetID (str): Unique identifier column for study. Defaults to 'population'.
+        quiet (bool, optional): Don't print incomplete studies. Defaults to False.
 
     Returns:
         pd.DataFrame: Allele frequency data of multiple studies, but only complete studies.
     """
     noncomplete = incomplete_studies(
-        AFtab=AFtab, llimit=llimit, ulimit=ulimit, datasetID=datasetID
+        AFtab=AFtab, llimit=llimit, ulimit=ulimit, datasetID=datasetID, quiet=quiet
     )
     # Returns False if population AND loci are in the noncomplete.index
     # AS A PAIR
     # This is important so that we don't throw away all data on a population
     # just because one loci is incomplete.
-    complete_mask = AFtab.apply(
-        lambda x: (x[datasetID], x.loci) not in noncomplete.index, axis=1
-    )
+    pairs = pd.MultiIndex.from_arrays([AFtab[datasetID], AFtab.loci])
+    complete_mask = ~pairs.isin(noncomplete.index)
     df = AFtab[complete_mask]
     return df
 
@@ -315,7 +793,7 @@ def check_resolution(AFtab):
     Returns:
         bool: True only if all alleles have the same resolution, else False.
     """
-    resolution = 1 + AFtab.allele.str.count(":")
+    resolution = HLAfreq_allele.resolution(AFtab.allele)
     resVC = resolution.value_counts()
     pass_check = len(resVC) == 1
     if not pass_check:
@@ -336,45 +814,37 @@ def decrease_resolution(AFtab, newres, datasetID="population"):
     Returns:
         pd.DataFrame: Allele frequency data with all alleles of requested resolution.
     """
+    if newres < 1:
+        raise AssertionError(f"newres must be at least 1, not {newres}")
     df = AFtab.copy()
-    resolution = 1 + df.allele.str.count(":")
+    resolution = HLAfreq_allele.resolution(df.allele)
     if not all(resolution >= newres):
         raise AssertionError(f"Some alleles have resolution below {newres} fields")
-    new_allele = df.allele.str.split(":").apply(lambda x: ":".join(x[:newres]))
-    df.allele = new_allele
+    df.allele = HLAfreq_allele.truncate(df.allele, newres)
     collapsed = collapse_reduced_alleles(df, datasetID=datasetID)
-    return collapsed
+    return _match_dtypes(collapsed, AFtab)
 
 
 def collapse_reduced_alleles(AFtab, datasetID="population"):
     df = AFtab.copy()
     # Group by alleles within datasets
-    grouped = df.groupby([datasetID, "allele"])
+    grouped = df.groupby([datasetID, "allele"], observed=True)
     # Sum allele freq but keep other columns
-    collapsed = grouped.apply(
-        lambda row: [
-            sum(row.allele_freq),
-            row.sample_size.unique()[0],
-            row.loci.unique()[0],
-            len(row.loci.unique()),
-            len(row.sample_size.unique()),
-        ]
-    )
-    collapsed = pd.DataFrame(
-        collapsed.tolist(),
-        index=collapsed.index,
-        columns=["allele_freq", "sample_size", "loci", "#loci", "#sample_sizes"],
+    collapsed = grouped.agg(
+        allele_freq=("allele_freq", "sum"),
+        sample_size=("sample_size", "first"),
+        loci=("loci", "first"),
     ).reset_index()
+    counts = grouped[["loci", "sample_size"]].nunique(dropna=False)
     # Within a study each all identical alleles should have the same loci and sample size
-    if not all(collapsed["#loci"] == 1):
+    if not all(counts.loci == 1):
         raise AssertionError("Multiple loci found for a single allele in a single population")
-    if not all(collapsed["#sample_sizes"] == 1):
+    if not all(counts.sample_size == 1):
         raise AssertionError("Multiple sample_sizes found for a single allele in a single population")
     collapsed = collapsed[
-        ["allele", "loci", "population", "allele_freq", "sample_size"]
+        ["allele", "loci", datasetID, "allele_freq", "sample_size"]
     ]
-    alleles_unique_in_study(collapsed)
-    return collapsed
+    return _match_dtypes(collapsed, AFtab)
 
 
 def unmeasured_alleles(AFtab, datasetID="population"):
@@ -390,44 +860,43 @@ def unmeasured_alleles(AFtab, datasetID="population"):
             for each dataset
     """
     df = AFtab.copy()
-    loci = df.loci.unique()
+    missing = []
     # Iterate over loci separately
-    for locus in loci:
-        # Iterate over each dataset reporting that locus
-        datasets = df[df.loci == locus][datasetID].unique()
-        for dataset in datasets:
-            # Single locus, single dataset
-            datasetAF = df[(df[datasetID] == dataset) & (df.loci == locus)]
-            # What was the sample size for this data?
-            dataset_sample_size = datasetAF.sample_size.unique()
-            if not (len(dataset_sample_size) == 1):
-                raise AssertionError("dataset_sample_size must be 1, not %s" % len(dataset_sample_size))
-            dataset_sample_size = dataset_sample_size[0]
-            # Get all alleles for this locus (across datasets)
-            ualleles = df[df.loci == locus].allele.unique()
-            # Which of these alleles are not in this dataset?
-            missing_alleles = [
-                allele for allele in ualleles if not allele in datasetAF.allele.values
-            ]
-            missing_rows = [
-                (al, locus, dataset, 0, 0, dataset_sample_size)
-                for al in missing_alleles
-            ]
-            missing_rows = pd.DataFrame(
-                missing_rows,
-                columns=[
-                    "allele",
-                    "loci",
-                    datasetID,
-                    "allele_freq",
-                    "carriers%",
-                    "sample_size",
-                ],
+    for locus in df.loci.unique():
+        locusAF = df[df.loci == locus]
+        # Each dataset must have a single sample size for this locus
+        grouped = locusAF.groupby(datasetID, sort=False, observed=True).sample_size
+        n_sample_sizes = grouped.nunique(dropna=False)
+        if not all(n_sample_sizes == 1):
+            raise AssertionError(
+                "dataset_sample_size must be 1, not %s"
+                % n_sample_sizes[n_sample_sizes != 1].iloc[0]
             )
-            # Add them in with zero frequency
-            if not missing_rows.empty:
-                df = pd.concat([df, missing_rows], ignore_index=True)
-    return df
+        # Every dataset reporting this locus with every allele of the locus
+        datasets = np.asarray(locusAF[datasetID].unique(), dtype=object)
+        ualleles = np.asarray(locusAF.allele.unique(), dtype=object)
+        every = pd.MultiIndex.from_product([datasets, ualleles])
+        reported = pd.MultiIndex.from_arrays([locusAF[datasetID], locusAF.allele])
+        absent = every[~every.isin(reported)]
+        if absent.empty:
+            continue
+        dataset = absent.get_level_values(0)
+        missing.append(
+            pd.DataFrame(
+                {
+                    "allele": absent.get_level_values(1),
+                    "loci": locus,
+                    datasetID: dataset,
+                    "allele_freq": 0,
+                    "carriers%": 0,
+                    "sample_size": grouped.first().reindex(dataset).to_numpy(),
+                }
+            )
+        )
+    # Add them in with zero frequency
+    if missing:
+        df = pd.concat([df] + missing, ignore_index=True)
+    return _match_dtypes(df, AFtab)
 
 
 def combineAF(
@@ -453,7 +922,9 @@ def combineAF(
     the prior defaults to 1 observation of each allele.
 
     Args:
-        AFtab (pd.DataFrame): Table of Allele frequency data
+        AFtab (pd.DataFrame): Table of Allele frequency data, or an
+            `HLAfreq_matrix.AFMatrix`, in which case `weights` must be '2n' or
+            'sample_size' and `format` and `unique` are not used.
         weights (str, optional): Column to be weighted by allele frequency to generate
             concentration parameter of Dirichlet distribution. Defaults to '2n'.
         alpha (list, optional): Prior to use for Dirichlet distribution. Defaults to [].
@@ -482,50 +953,236 @@ def combineAF(
             *sample_size* is the total sample size of all combined studies.
             *wav* is the weighted average.
     """
+    if isinstance(AFtab, HLAfreq_matrix.AFMatrix):
+        AFtab.validate().check(complete=complete, resolution=resolution)
+        return AFtab.combine(weights, alpha, add_unmeasured)
+    if format and not is_formatted(AFtab):
+        AFtab = formatAF(AFtab, ignoreG)
+    # All checks in one pass
+    report = HLAfreq_validate.validate(AFtab, datasetID=datasetID)
+    report.check(unique=unique, complete=complete, resolution=resolution)
     df = AFtab.copy()
-    single_loci(df)
-    if unique:
-        if not alleles_unique_in_study(df, datasetID=datasetID):
-            raise AssertionError("The same allele appears multiple times in a dataset")
-    if complete:
-        if not incomplete_studies(df, datasetID=datasetID).empty:
-            raise AssertionError("AFtab contains studies with AF that doesn't sum to 1. Checkincomplete_studies(AFtab)")
-    if resolution:
-        if not check_resolution(df):
-            raise AssertionError("AFtab conains alleles at multiple resolutions, check check_resolution(AFtab)")
-    if format:
-        df = formatAF(df, ignoreG)
     if add_unmeasured:
         df = unmeasured_alleles(df, datasetID)
+    combined = _combine(df, weights, alpha)
+    return _match_dtypes(combined, AFtab[["allele", "loci"]])
+
+
+def combineAF_loci(
+    AFtab,
+    weights="2n",
+    alpha={},
+    datasetID="population",
+    format=True,
+    ignoreG=True,
+    add_unmeasured=True,
+    complete=True,
+    resolution=True,
+    unique=True,
+):
+    """Combine allele frequencies from multiple studies, for all loci at once.
+
+    Each locus is combined as by `combineAF()`, with its own prior and
+    Dirichlet distribution, in a single grouped pass rather than splitting
+    the data by locus and calling `combineAF()` for each.
+
+    Args:
+        AFtab (pd.DataFrame): Table of Allele frequency data of any number of loci,
+            or an `HLAfreq_matrix.AFMatrix`.
+        weights (str, optional): Column to be weighted by allele frequency to generate
+            concentration parameter of Dirichlet distribution. Defaults to '2n'.
+        alpha (dict, optional): Prior to use for the Dirichlet distribution of each
+            locus, as locus to list of prior values in alphabetical order of the
+            locus's alleles. Loci not in `alpha` use `default_prior()`.
+            Defaults to {}.
+        datasetID (str, optional): Unique identifier column for study. Defaults to
+            'population'.
+        format (bool, optional): Run `formatAF()`. Defaults to True.
+        ignoreG (bool, optional): Treat allele G groups as normal, see `formatAF()`.
+            Defaults to True.
+        add_unmeasured (bool, optional): Add unmeasured alleles to each study, see
+            `combineAF()`. Defaults to True.
+        complete (bool, optional): Check study completeness of each locus.
+            Defaults to True.
+        resolution (bool, optional): Check that all alleles, of all loci, have the
+            same resolution. Defaults to True.
+        unique (bool, optional): Check that each allele appears no more than once per
+            study. Defaults to True.
+
+    Returns:
+        pd.DataFrame: Allele frequencies after combining estimates from all studies,
+            with the columns of `combineAF()`, sorted by locus and then allele.
+    """
+    if isinstance(AFtab, HLAfreq_matrix.AFMatrix):
+        AFtab.validate().check(
+            complete=complete, resolution=resolution, single_locus=False
+        )
+        return AFtab.combine(weights, alpha, add_unmeasured)
+    if format and not is_formatted(AFtab):
+        AFtab = formatAF(AFtab, ignoreG)
+    report = HLAfreq_validate.validate(AFtab, datasetID=datasetID)
+    report.check(
+        unique=unique, complete=complete, resolution=resolution, single_locus=False
+    )
+    df = AFtab.copy()
+    if add_unmeasured:
+        df = unmeasured_alleles(df, datasetID)
+    combined = _combine(df, weights, alpha)
+    return _match_dtypes(combined, AFtab[["allele", "loci"]])
+
+
+def combineAF_grouped(
+    AFtab,
+    by="country",
+    countries=None,
+    weights="2n",
+    datasetID="population",
+    format=True,
+    ignoreG=True,
+    add_unmeasured=True,
+    complete=True,
+    resolution=True,
+    unique=True,
+    workers=1,
+):
+    """Combine allele frequencies of each group of studies, e.g. each country.
+
+    Each group and locus is combined as by `combineAF()` on that group and
+    locus alone, with the default prior, in a single grouped pass over all
+    groups. Filter and decrease resolution of the whole table first, with
+    `only_complete()` and `decrease_resolution()`, as both work per study.
+
+    ```
+    aftabs, status = HLAfreq.getAFbatch({c: {"country": c, "locus": "A"} for c in countries})
+    aftab = pd.concat(aftabs, names=["country"]).reset_index(level=0)
+    aftab = HLAfreq.decrease_resolution(HLAfreq.only_complete(aftab), 2)
+    caf = HLAfreq.combineAF_grouped(aftab, by="largeRegion")
+    ```
+
+    Args:
+        AFtab (pd.DataFrame): Table of Allele frequency data of many groups.
+        by (str, optional): Column to group studies by. If it is not a column of
+            `AFtab`, it is looked up in `countries` from the `country` column of
+            `AFtab`, e.g. 'Region' or 'largeRegion'. Defaults to 'country'.
+        countries (pd.DataFrame, optional): `Country` and the `by` column of each
+            country. Defaults to `HLAfreq_data.load_countries()`, only loaded
+            if `by` is not a column of `AFtab`.
+        weights (str, optional): Column to be weighted by allele frequency to generate
+            concentration parameter of Dirichlet distribution. Defaults to '2n'.
+        datasetID (str, optional): Unique identifier column for study. Defaults to
+            'population'.
+        format (bool, optional): Run `formatAF()`. Defaults to True.
+        ignoreG (bool, optional): Treat allele G groups as normal, see `formatAF()`.
+            Defaults to True.
+        add_unmeasured (bool, optional): Add alleles reported by other studies of
+            the same group to each study, see `combineAF()`. Defaults to True.
+        complete (bool, optional): Check study completeness. Defaults to True.
+        resolution (bool, optional): Check that all alleles have the same resolution.
+            Defaults to True.
+        unique (bool, optional): Check that each allele appears no more than once per
+            study. Defaults to True.
+        workers (int, optional): Number of processes to combine groups in,
+            for very large tables. Defaults to 1, combine in this process.
+
+    Returns:
+        pd.DataFrame: Allele frequencies of each group after combining estimates
+            from the group's studies, the `by` column and the columns of
+            `combineAF()`, sorted by group, locus and allele.
+    """
+    if format and not is_formatted(AFtab):
+        AFtab = formatAF(AFtab, ignoreG)
+    if by not in AFtab.columns:
+        if "country" not in AFtab.columns:
+            raise AssertionError("AFtab must have a '%s' or 'country' column" % by)
+        if countries is None:
+            # Imported here so that importing HLAfreq does not need pkg_resources
+            from HLAfreq import HLAfreq_data
+
+            countries = HLAfreq_data.load_countries()
+        AFtab = AFtab.assign(
+            **{by: AFtab.country.map(countries.set_index("Country")[by])}
+        )
+    ungrouped = AFtab[by].isna()
+    if ungrouped.any():
+        print("%s rows with no %s are not combined" % (ungrouped.sum(), by))
+        AFtab = AFtab[~ungrouped]
+    report = HLAfreq_validate.validate(AFtab, datasetID=datasetID)
+    report.check(
+        unique=unique, complete=complete, resolution=resolution, single_locus=False
+    )
+    if workers > 1:
+        # Groups are combined independently, so split groups between processes
+        groups = np.array_split(AFtab[by].unique(), workers)
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    _combine_groups,
+                    AFtab[AFtab[by].isin(group)],
+                    by,
+                    weights,
+                    datasetID,
+                    add_unmeasured,
+                )
+                for group in groups
+                if len(group)
+            ]
+            combined = pd.concat([f.result() for f in futures], ignore_index=True)
+        combined = combined.sort_values([by, "loci", "allele"], ignore_index=True)
+    else:
+        combined = _combine_groups(AFtab, by, weights, datasetID, add_unmeasured)
+    return _match_dtypes(combined, AFtab[[by, "allele", "loci"]])
+
+
+def _combine_groups(AFtab, by, weights, datasetID, add_unmeasured):
+    """Combine each group and locus of checked data, see `combineAF_grouped()`"""
+    df = AFtab.copy()
+    keys = [by, "loci"]
+    if add_unmeasured:
+        # Every study of a group with every allele of that group, for each locus
+        studies = df[keys + [datasetID, "sample_size"]].drop_duplicates()
+        if studies.duplicated(keys + [datasetID]).any():
+            raise AssertionError("dataset_sample_size must be 1 for each study")
+        alleles = df[keys + ["allele"]].drop_duplicates()
+        every = studies.merge(alleles, on=keys)
+        columns = keys + [datasetID, "allele"]
+        reported = pd.MultiIndex.from_frame(df[columns])
+        missing = every[~pd.MultiIndex.from_frame(every[columns]).isin(reported)]
+        df = pd.concat([df, missing.assign(allele_freq=0)], ignore_index=True)
+    return _combine(df, weights, {}, by=by)
+
+
+def _combine(df, weights, alpha, by=None):
+    """Combine each allele of checked data, see `combineAF()`.
+
+    Alleles of each locus, and each group of `by` if given, are combined with
+    their own Dirichlet distribution. Unmeasured alleles must already be added.
+    """
+    keys = ["loci"] if by is None else [by, "loci"]
     try:
         df["2n"] = df.sample_size * 2
     except AttributeError:
         print("column '2n' could not be created")
     df["c"] = df.allele_freq * df[weights]
-    grouped = df.groupby("allele", sort=True)
-    combined = grouped.apply(
-        lambda row: [
-            row.name,
-            row.loci.unique()[0],
-            np.average(row.allele_freq, weights=row[weights]),
-            row.c.sum(),
-            row.sample_size.sum(),
-        ]
+    df["weight"] = df[weights]
+    combined = (
+        df.groupby(keys + ["allele"], sort=True, observed=True)
+        .agg(c=("c", "sum"), weight=("weight", "sum"), sample_size=("sample_size", "sum"))
+        .reset_index()
     )
-    combined = pd.DataFrame(
-        combined.tolist(), columns=["allele", "loci", "wav", "c", "sample_size"]
-    )
-    combined = combined.reset_index(drop=True)
+    combined["wav"] = combined.c / combined.weight
+    combined = combined[keys[:-1] + ["allele", "loci", "wav", "c", "sample_size"]]
     # Check that all alleles in a locus have the same sample size
     # after merging
-    if duplicated_sample_size(combined):
-        id_duplicated_allele(grouped)
-    if not alpha:
-        alpha = default_prior(len(combined.allele))
-    combined["alpha"] = alpha
-    # Calculate Dirichlet mean for each allele
-    combined["allele_freq"] = sp.stats.dirichlet(combined.alpha + combined.c).mean()
-
+    if combined.groupby(keys, observed=True).sample_size.nunique().gt(1).any():
+        id_duplicated_allele(df.groupby(keys + ["allele"], observed=True))
+    combined["alpha"] = locus_prior(combined.loci, alpha)
+    # Dirichlet mean for each allele, separately for each locus
+    concentration = combined.alpha + combined.c
+    if not np.all(concentration > 0):
+        raise ValueError("All parameters must be greater than 0")
+    combined["allele_freq"] = concentration / concentration.groupby(
+        [combined[key] for key in keys], observed=True
+    ).transform("sum")
     return combined
 
 
@@ -542,6 +1199,36 @@ def default_prior(k):
     return alpha
 
 
+def locus_prior(loci, alpha={}):
+    """Prior of each allele, for alleles of one or more loci.
+
+    Args:
+        loci (list): Locus of each allele, alleles of each locus in alphabetical
+            order.
+        alpha (list or dict, optional): Prior of all alleles, or a dict of locus
+            to the prior of that locus's alleles. Alleles without a prior use
+            `default_prior()`. Defaults to {}.
+
+    Returns:
+        list: Prior of each allele.
+    """
+    if not isinstance(alpha, dict):
+        if not alpha:
+            alpha = default_prior(len(loci))
+        return alpha
+    prior = default_prior(len(loci))
+    loci = np.asarray(loci, dtype=object)
+    for locus, locus_alpha in alpha.items():
+        rows = np.flatnonzero(loci == locus)
+        if not len(rows) == len(locus_alpha):
+            raise AssertionError(
+                "For k alleles of locus %s, prior must be length k" % locus
+            )
+        for i, value in zip(rows, locus_alpha):
+            prior[i] = value
+    return prior
+
+
 def single_loci(AFtab):
     """Check that allele frequency data is only of one locus
 
@@ -567,7 +1254,7 @@ def alleles_unique_in_study(AFtab, datasetID="population"):
         bool: `True` on if no alleles occur more than once in any study, otherwise `False`.
     """
     df = AFtab.copy()
-    grouped = df.groupby([datasetID, "allele"])
+    grouped = df.groupby([datasetID, "allele"], observed=True)
     # Are allele alleles unique? i.e. do any occur multiple times in grouping?
     unique = grouped.size()[grouped.size() > 1].empty
     if not unique:
@@ -578,7 +1265,7 @@ def alleles_unique_in_study(AFtab, datasetID="population"):
 
 def duplicated_sample_size(AFtab):
     """Returns True if any loci has more than 1 unique sample size"""
-    locus_sample_sizes = AFtab.groupby("loci").sample_size.apply(
+    locus_sample_sizes = AFtab.groupby("loci", observed=True).sample_size.apply(
         lambda x: len(x.unique())
     )
     return any(locus_sample_sizes != 1)
@@ -595,11 +1282,14 @@ def population_coverage(p):
     """Proportion of people with at least 1 copy of this allele assuming HWE.
 
     Args:
-        p (float): Allele frequency
+        p (float): Allele frequency, or an `HLAfreq_matrix.AFMatrix` for the
+            coverage of each allele in each study.
 
     Returns:
         float: Sum of homozygotes and heterozygotes for this allele
     """
+    if isinstance(p, HLAfreq_matrix.AFMatrix):
+        p = p.to_frame()
     q = 1 - p
     homo = p**2
     hetero = 2 * p * q
@@ -624,41 +1314,67 @@ def betaAB(alpha):
     return ab
 
 
-# def betaCI(a,b,credible_interval=0.95):
-#     """Calculat the central credible interval of a beta distribution
+def betaCI(a, b, credible_interval=0.95):
+    """Calculate the central credible interval of beta distributions.
+
+    Args:
+        a (float or np.array): Beta shape parameter `a`, i.e. the number of times the
+            allele was observed.
+        b (float or np.array): Beta shape parameter `b`, i.e. the number of times the
+            allele was not observed.
+        credible_interval (float, optional): The size of the credible interval requested.
+            Defaults to 0.95.
 
-#     Args:
-#         a (float): Beta shape parameter `a`, i.e. the number of times the allele was observed.
-#         b (float): Beta shape parameter `b`, i.e. the number of times the allele was not observed.
-#         credible_interval (float, optional): The size of the credible interval requested. Defaults to 0.95.
+    Returns:
+        tuple: Lower and upper credible interval of each beta distribution.
+    """
+    lower_quantile = (1 - credible_interval) / 2
+    upper_quantile = 1 - lower_quantile
+    # Both quantiles of all distributions in one call
+    quantiles = np.array([[lower_quantile], [upper_quantile]])
+    lower_interval, upper_interval = sp.stats.beta.ppf(
+        quantiles, np.atleast_1d(a), np.atleast_1d(b)
+    )
+    if np.ndim(a) == 0 and np.ndim(b) == 0:
+        return lower_interval[0], upper_interval[0]
+    return lower_interval, upper_interval
 
-#     Returns:
-#         tuple: Lower and upper credible interval of beta distribution.
-#     """
-#     bd = sp.stats.beta(a,b)
-#     lower_quantile = (1-credible_interval)/2
-#     upper_quantile = 1-lower_quantile
-#     lower_interval = bd.ppf(lower_quantile)
-#     upper_interval = bd.ppf(upper_quantile)
-#     return lower_interval, upper_interval
 
-# def AFci(caf, credible_interval=0.95):
-#     """Calculate credible interval for combined allele frequency table.
-#     Note that this ignores sampling error so confidence interval is too tight.
-#     Use HLAhdi.AFhdi() instead.
+def AFci(caf, credible_interval=0.95, by=None):
+    """Calculate credible interval for combined allele frequency table.
 
-#     Args:
-#         caf (pd.DataFrame): Table produced by combineAF()
-#         credible_interval (float, optional): The desired confidence interval. Defaults to 0.95.
+    The interval of each allele is from the beta marginal of the Dirichlet
+    posterior, see `betaAB()`, calculated for all alleles at once. This is
+    milliseconds rather than the minutes of fitting `HLAfreq_pymc.AFhdi()`.
+    Note that this ignores sampling error so confidence interval is too tight,
+    use `HLAfreq_pymc.AFhdi()` for accurate intervals.
 
-#     Returns:
-#         list: Lower and upper credible intervals as a list of tuples
-#     """
-#     ab = betaAB(
-#         caf.alpha + caf.c,
-#     )
-#     ci = [betaCI(a, b, credible_interval) for a,b in ab]
-#     return ci
+    Args:
+        caf (pd.DataFrame): Table produced by `combineAF()`, `combineAF_loci()` or
+            `combineAF_grouped()`.
+        credible_interval (float, optional): The desired confidence interval.
+            Defaults to 0.95.
+        by (str, optional): Group column of `combineAF_grouped()` output. Each
+            group and locus is a separate Dirichlet distribution. Defaults to
+            None, each locus is a separate Dirichlet distribution.
+
+    Returns:
+        pd.DataFrame: Lower (`lo`) and upper (`hi`) credible interval, `allele`, and
+            posterior mean (`post_mean`) of each allele, as `HLAfreq_pymc.AFhdi()`,
+            so it can be plotted with `plotAF(hdi=...)`. Includes the `by` column
+            if given.
+    """
+    keys = ["loci"] if by is None else [by, "loci"]
+    a = (caf.alpha + caf.c).astype(np.float64)
+    total = a.groupby([caf[key] for key in keys], observed=True).transform("sum")
+    lo, hi = betaCI(a.to_numpy(), (total - a).to_numpy(), credible_interval)
+    ci = pd.DataFrame(
+        {"lo": lo, "hi": hi, "allele": caf.allele, "post_mean": a / total},
+        index=caf.index,
+    )
+    if by is not None:
+        ci.insert(0, by, caf[by])
+    return ci
 
 
 def plot_prior(concentration, ncol=2, psteps=1000, labels=""):
@@ -723,7 +1439,8 @@ def plotAF(
         weights (str, optional): Column to be weighted by allele frequency to generate
             concentration parameter of Dirichlet distribution. Defaults to '2n'.
         hdi (pd.DataFrame, optional): The high density interval object to plot credible
-            intervals. Produced by HLAfreq.HLA_pymc.AFhdi(). Defaults to pd.DataFrame().
+            intervals. Produced by HLAfreq.HLA_pymc.AFhdi() or `AFci()`. Defaults to
+            pd.DataFrame().
         compound_mean (pd.DataFrame, optional): The high density interval object to plot
             post_mean. Produced by HLAfreq.HLA_pymc.AFhdi(). Defaults to pd.DataFrame().
     """
@@ -0,0 +1,161 @@
+"""
+Parsed allele names.
+
+HLA allele names such as `A*02:01:01:02L` are a locus, up to four fields
+separated by `:`, and an optional expression suffix. Rather than splitting
+allele strings on every row each time they are needed, each distinct name
+is parsed once and the result cached. Functions here take a column of
+allele names and return per row results, only parsing names not seen
+before, so sorting, resolution checks and truncation work on integer
+arrays.
+
+```
+from HLAfreq import HLAfreq_allele
+HLAfreq_allele.allele_fields(aftab.allele)
+aftab.sort_values("allele", key=HLAfreq_allele.allele_rank)
+```
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+FIELDS = ["field1", "field2", "field3", "field4"]
+_SUFFIX = re.compile(r"[A-Za-z]+$")
+
+# Allele name to (locus, field1, field2, field3, field4, suffix, resolution)
+_parsed = {}
+
+
+def parse_allele(name):
+    """Parse a single allele name.
+
+    Args:
+        name (str): Allele name, e.g. "A*02:01:01G".
+
+    Returns:
+        tuple: locus, integer fields 1 to 4 (-1 if absent or not a number),
+            expression suffix ("" if none), and resolution (number of fields).
+    """
+    locus, _, rest = name.partition("*")
+    fields = name.split(":")
+    resolution = len(fields)
+    suffix = _SUFFIX.search(rest)
+    suffix = suffix.group() if suffix else ""
+    rest = rest[: len(rest) - len(suffix)]
+    numbers = [int(f) if f.isdigit() else -1 for f in rest.split(":")[:4]]
+    numbers += [-1] * (4 - len(numbers))
+    return (locus, *numbers, suffix, resolution)
+
+
+def _factorize(alleles):
+    """Code of each row and the distinct allele names, -1 for missing"""
+    if isinstance(alleles.dtype, pd.CategoricalDtype):
+        return alleles.cat.codes.to_numpy(), alleles.cat.categories
+    return pd.factorize(np.asarray(alleles, dtype=object))
+
+
+def _distinct(alleles):
+    """Codes of each row and parsed distinct alleles, parsing new names only"""
+    codes, uniques = _factorize(alleles)
+    for name in uniques:
+        if name not in _parsed:
+            _parsed[name] = parse_allele(name)
+    return codes, [_parsed[name] for name in uniques]
+
+
+def _take(values, codes, alleles, fill):
+    """Per row values from per distinct allele values, `fill` for missing"""
+    # Missing alleles have code -1, the appended `fill`
+    values = np.append(np.asarray(values), fill)
+    return pd.Series(values[codes], index=alleles.index, name=alleles.name)
+
+
+def allele_fields(alleles):
+    """Parse a column of allele names.
+
+    Args:
+        alleles (pd.Series): Allele names.
+
+    Returns:
+        pd.DataFrame: `locus`, `field1` to `field4` as integers (-1 if absent or
+            not a number), expression `suffix`, and `resolution` of each allele,
+            with the index of `alleles`. Missing allele names are -1 or "".
+    """
+    codes, parsed = _distinct(alleles)
+    columns = ["locus"] + FIELDS + ["suffix", "resolution"]
+    table = pd.DataFrame(parsed, columns=columns)
+    fill = pd.DataFrame([["", -1, -1, -1, -1, "", -1]], columns=columns)
+    # Missing alleles have code -1, the appended `fill` row
+    table = pd.concat([table, fill], ignore_index=True)
+    df = table.take(codes).set_axis(alleles.index)
+    return df.astype({column: np.int32 for column in FIELDS + ["resolution"]})
+
+
+def loci(alleles):
+    """Locus of each allele, the text before `*`.
+
+    Args:
+        alleles (pd.Series): Allele names.
+
+    Returns:
+        pd.Series: Locus of each allele, NaN for missing allele names.
+    """
+    codes, parsed = _distinct(alleles)
+    return _take(np.array([p[0] for p in parsed], dtype=object), codes, alleles, np.nan)
+
+
+def resolution(alleles):
+    """Number of fields of each allele.
+
+    Args:
+        alleles (pd.Series): Allele names.
+
+    Returns:
+        pd.Series: Resolution of each allele, NaN for missing allele names.
+    """
+    codes, parsed = _distinct(alleles)
+    values = np.array([p[6] for p in parsed], dtype=np.int64)
+    if (codes == -1).any():
+        return _take(values.astype(float), codes, alleles, np.nan)
+    return pd.Series(values[codes], index=alleles.index, name=alleles.name)
+
+
+def truncate(alleles, newres):
+    """Keep only the first `newres` fields of each allele.
+
+    Args:
+        alleles (pd.Series): Allele names.
+        newres (int): Number of fields to keep.
+
+    Returns:
+        pd.Series: Truncated allele names, NaN for missing allele names.
+    """
+    codes, uniques = _factorize(alleles)
+    values = np.array([":".join(name.split(":")[:newres]) for name in uniques], dtype=object)
+    return _take(values, codes, alleles, np.nan)
+
+
+def allele_rank(alleles):
+    """Rank of each allele in numeric order of locus, fields, and suffix.
+
+    Sorts e.g. A*02:10 after A*02:9, unlike sorting allele names as text.
+    Use as `AFtab.sort_values("allele", key=allele_rank)`.
+
+    Args:
+        alleles (pd.Series): Allele names.
+
+    Returns:
+        pd.Series: Integer rank of each allele, equal alleles have equal rank.
+            Missing allele names rank last.
+    """
+    codes, parsed = _distinct(alleles)
+    order = sorted(range(len(parsed)), key=lambda i: parsed[i][:6])
+    ranks = np.empty(len(parsed), dtype=np.int64)
+    ranks[order] = np.arange(len(parsed))
+    return _take(ranks, codes, alleles, len(parsed))
+
+
+def clear_cache():
+    """Forget all parsed allele names"""
+    _parsed.clear()
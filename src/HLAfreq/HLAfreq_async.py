@@ -0,0 +1,233 @@
+"""
+Download allele frequency data with asyncio.
+
+Async equivalents of `HLAfreq.getAFdata()` and `HLAfreq.Npages()` for use
+within an event loop, e.g. in a web service. Pages are downloaded
+concurrently with `aiohttp`, at most `workers` at once, and parsed in an
+executor so that the event loop is never blocked. Many searches can be
+downloaded at once without a thread for each.
+
+```
+import asyncio
+from HLAfreq import HLAfreq_async
+
+async def main():
+    urls = [HLAfreq.makeURL(country, locus="A") for country in ["Uganda", "Kenya"]]
+    async with aiohttp.ClientSession() as session:
+        return await asyncio.gather(
+            *[HLAfreq_async.getAFdata(url, session=session) for url in urls]
+        )
+
+aftabs = asyncio.run(main())
+```
+
+Failed requests are retried with exponential backoff as by
+`HLAfreq_session.AFSession`. Pages are read from and stored in the same
+`HLAfreq_cache` caches and checkpoints as `HLAfreq.getAFdata()`.
+
+Requires `aiohttp`, install with `pip install HLAfreq[async]`.
+"""
+
+import asyncio
+import functools
+import aiohttp
+import HLAfreq
+from HLAfreq import HLAfreq_cache
+from HLAfreq.HLAfreq import _concatPages, _formatPage
+
+# Statuses retried, as by HLAfreq_session.AFSession
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+async def _run(executor, function, *args):
+    """Run `function(*args)` in `executor` without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(function, *args))
+
+
+async def _get(url, session, timeout, retries, backoff_factor):
+    """Get the text of `url`, retrying failed requests"""
+    for retry in range(retries + 1):
+        if retry:
+            await asyncio.sleep(backoff_factor * 2 ** (retry - 1))
+        try:
+            async with session.get(
+                url, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                if response.status in _RETRY_STATUS and retry < retries:
+                    continue
+                response.raise_for_status()
+                return await response.text()
+        except asyncio.TimeoutError as e:
+            if retry == retries:
+                raise Exception(
+                    "Requests timeout, try a larger `timeout` value for `getAFdata()`"
+                ) from e
+        except aiohttp.ClientConnectionError as e:
+            if retry == retries:
+                raise Exception(
+                    "Request failed after retries, try a larger `timeout` value for"
+                    " `getAFdata()` or more `retries`"
+                ) from e
+
+
+async def getPageText(
+    url, session, timeout=20, cache=None, retries=3, backoff_factor=0.5
+):
+    """Download the text of a single allelefrequencies.net results page.
+
+    Args:
+        url (str): URL of the results page.
+        session (aiohttp.ClientSession): Session to download with.
+        timeout (int, optional): How long to wait to receive a response.
+            Defaults to 20.
+        cache (HLAfreq_cache.ResponseCache, optional): Cache to read the page
+            from and store it in. Defaults to the default cache, see
+            `HLAfreq_cache.set_cache()`. Set False to not use a cache.
+        retries (int, optional): Number of times to retry a failed request.
+            Defaults to 3.
+        backoff_factor (float, optional): Retries wait
+            `backoff_factor * 2 ** (retry - 1)` seconds. Defaults to 0.5.
+
+    Returns:
+        str: Text of the results page
+    """
+    if cache is None:
+        cache = HLAfreq_cache.get_cache()
+    if cache:
+        text = await _run(None, cache.get, url)
+        if text is not None:
+            return text
+        if cache.offline:
+            raise Exception("Page is not in the offline cache %s: %s" % (cache.path, url))
+    text = await _get(url, session, timeout, retries, backoff_factor)
+    if cache:
+        await _run(None, cache.set, url, text)
+    return text
+
+
+async def Npages(base_url, session=None, timeout=20, cache=None, executor=None):
+    """How many pages of results are there for a search?
+
+    Args:
+        base_url (str): URL for base search.
+        session (aiohttp.ClientSession, optional): Session to download with.
+            Defaults to a new session for this call.
+        timeout (int, optional): How long to wait to receive a response.
+            Defaults to 20.
+        cache (HLAfreq_cache.ResponseCache, optional): On disk cache of downloaded
+            pages, see `getPageText()`.
+        executor (concurrent.futures.Executor, optional): Executor to parse the
+            page in. Defaults to the event loop's default executor.
+
+    Returns:
+        int: Total number of results pages
+    """
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await Npages(base_url, session, timeout, cache, executor)
+    text = await getPageText(base_url, session, timeout, cache)
+    return await _run(executor, HLAfreq.Npages, text)
+
+
+async def getAFdata(
+    base_url,
+    timeout=20,
+    format=True,
+    ignoreG=True,
+    workers=4,
+    session=None,
+    cache=None,
+    checkpoint=None,
+    compact=False,
+    executor=None,
+    semaphore=None,
+    retries=3,
+    backoff_factor=0.5,
+):
+    """Get all allele frequency data from a search base_url.
+
+    Returns the same data as `HLAfreq.getAFdata()`.
+
+    Args:
+        base_url (str): URL for base search.
+        timeout (int): How long to wait to receive a response.
+        format (bool): Format the downloaded data using `HLAfreq.formatAF()`.
+        ignoreG (bool): treat allele G groups as normal.
+            See http://hla.alleles.org/alleles/g_groups.html for details. Default = True
+        workers (int): Number of pages to download at once. Defaults to 4.
+        session (aiohttp.ClientSession, optional): Session to download with.
+            Defaults to a new session for this call, pass a session to share
+            connections between searches.
+        cache (HLAfreq_cache.ResponseCache): On disk cache of downloaded pages.
+            Defaults to the cache set with `HLAfreq_cache.set_cache()`, if any.
+            Set False to download every page even if a default cache is set.
+        checkpoint (str, optional): Directory to save each page to as it is
+            downloaded, removed once every page is downloaded, see
+            `HLAfreq.getAFdata()`. Defaults to None, no checkpoint.
+        compact (bool, optional): Return compact data types, see
+            `HLAfreq.compactAF()`. Compact data is formatted, so requires `format`.
+            Defaults to False.
+        executor (concurrent.futures.Executor, optional): Executor to parse pages
+            in. Defaults to the event loop's default executor.
+        semaphore (asyncio.Semaphore, optional): Limits pages downloaded at once,
+            pass the same semaphore to several searches to limit their total.
+            Defaults to a new semaphore of `workers`.
+        retries (int, optional): Number of times to retry a failed request.
+            Defaults to 3.
+        backoff_factor (float, optional): Retries wait
+            `backoff_factor * 2 ** (retry - 1)` seconds. Defaults to 0.5.
+
+    Returns:
+        pd.DataFrame: allele frequency data parsed into a pandas dataframe
+    """
+    if workers < 1:
+        raise AssertionError("workers must be at least 1, not %s" % workers)
+    if compact and not format:
+        raise AssertionError("compact data is formatted, compact requires format=True")
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await getAFdata(
+                base_url, timeout, format, ignoreG, workers, session, cache,
+                checkpoint, compact, executor, semaphore, retries, backoff_factor,
+            )
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(workers)
+
+    async def get(url):
+        async with semaphore:
+            return await getPageText(
+                url, session, timeout, cache, retries, backoff_factor
+            )
+
+    text = await get(base_url)
+    N = await _run(executor, HLAfreq.Npages, text)
+    print("%s pages of results" % N)
+    if checkpoint:
+        checkpoint = await _run(
+            None, HLAfreq_cache.PageCheckpoint, checkpoint, base_url, N
+        )
+
+    async def page(i):
+        if checkpoint and i in checkpoint:
+            return await _run(None, checkpoint.load, i)
+        text = await get(base_url + "page=" + str(i))
+        tab = await _run(executor, HLAfreq.parseAF, text)
+        if checkpoint:
+            await _run(None, checkpoint.save, i, tab)
+        return tab
+
+    tasks = [asyncio.ensure_future(page(i + 1)) for i in range(N)]
+    try:
+        tabs = await asyncio.gather(*tasks)
+    finally:
+        # Don't leave pages downloading if one has failed or we were cancelled
+        for task in tasks:
+            task.cancel()
+    if checkpoint:
+        await _run(None, checkpoint.remove)
+    print("Download complete")
+    tabs = _concatPages(tabs)
+    if compact:
+        return await _run(executor, HLAfreq.compactAF, tabs, ignoreG)
+    return await _run(executor, _formatPage, tabs, format, ignoreG)
@@ -0,0 +1,267 @@
+"""
+On disk cache of pages downloaded from allelefrequencies.net.
+
+Pages are stored gzip compressed, one file per URL. As each results page has
+its own URL (`page=N`) every page is cached separately. Cached pages expire
+after `ttl` seconds and the least recently used pages are removed once the
+cache is larger than `max_size` bytes.
+
+Pass a cache to `HLAfreq.getAFdata()` or set it as the default for all
+downloads with `set_cache()`. In `offline` mode only cached pages are used,
+expired or not, and requesting any other page raises an error.
+
+```
+from HLAfreq import HLAfreq_cache
+HLAfreq_cache.set_cache(HLAfreq_cache.ResponseCache("data/cache", ttl=7 * 24 * 3600))
+aftab = HLAfreq.getAFdata(base_url)
+```
+
+`PageCheckpoint` saves the parsed pages of a single search as they are
+downloaded, so that an interrupted `getAFdata(base_url, checkpoint=path)` can
+be rerun and only download the missing pages. The checkpoint of a search is
+removed once every page has been downloaded, so rerunning a completed
+search downloads it again.
+"""
+
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import pandas as pd
+
+
+class ResponseCache:
+    """Gzip compressed on disk cache of page text keyed by URL.
+
+    Args:
+        path (str): Directory to store cached pages in, created if needed.
+        ttl (float, optional): Seconds after download that a cached page expires.
+            `None` means pages never expire. Defaults to None.
+        max_size (int, optional): Maximum total size of the cache in bytes, least
+            recently used pages are removed above this. `None` means no limit.
+            Defaults to None.
+        offline (bool, optional): Only serve cached pages, never download.
+            Defaults to False.
+    """
+
+    def __init__(self, path, ttl=None, max_size=None, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _file(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key + ".html.gz")
+
+    def _entries(self):
+        """List of (path, stat) for every cached page"""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".html.gz"):
+                file = os.path.join(self.path, name)
+                try:
+                    entries.append((file, os.stat(file)))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def get(self, url):
+        """Get cached text of `url`.
+
+        Args:
+            url (str): URL of the page.
+
+        Returns:
+            str: Page text, or None if it is not cached or has expired. Expired
+                pages are still returned when `offline`.
+        """
+        file = self._file(url)
+        try:
+            stat = os.stat(file)
+            if (
+                not self.offline
+                and self.ttl is not None
+                and time.time() - stat.st_mtime > self.ttl
+            ):
+                return None
+            with gzip.open(file, "rt", encoding="utf-8") as f:
+                text = f.read()
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile):
+            return None
+        # Access time tracks use for LRU eviction, modified time is the
+        # download time used for ttl
+        try:
+            os.utime(file, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        return text
+
+    def set(self, url, text):
+        """Store `text` as the cached page for `url`.
+
+        Args:
+            url (str): URL of the page.
+            text (str): Page text.
+        """
+        file = self._file(url)
+        data = gzip.compress(text.encode("utf-8"))
+        # Write to a temporary file and rename so that a partially written
+        # page is never read
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self._lock:
+            try:
+                old_size = os.stat(file).st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp, file)
+            if self._size is not None:
+                self._size += len(data) - old_size
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used pages until the cache fits `max_size`"""
+        if self.max_size is None:
+            return
+        if self._size is None:
+            self._size = sum(stat.st_size for _, stat in self._entries())
+        if self._size <= self.max_size:
+            return
+        for file, stat in sorted(self._entries(), key=lambda x: x[1].st_atime):
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                continue
+            self._size -= stat.st_size
+
+    def clear(self):
+        """Remove all cached pages"""
+        with self._lock:
+            for file, _ in self._entries():
+                try:
+                    os.remove(file)
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+
+class PageCheckpoint:
+    """Parsed pages of a single search saved to disk as they are downloaded.
+
+    Each search is saved in its own directory within `path`, named by a hash
+    of the search URL. Pages are written atomically so an interrupted
+    download never leaves a partial page. If the number of pages of the
+    search has changed since the checkpoint was made the saved pages are
+    discarded, as results may have moved between pages. Downloads `remove()`
+    the checkpoint once they have every page.
+
+    Args:
+        path (str): Directory to save checkpoints in, created if needed.
+        base_url (str): URL of the search.
+        npages (int): Number of pages of results the search has now.
+    """
+
+    def __init__(self, path, base_url, npages):
+        key = hashlib.sha256(base_url.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(path, key)
+        os.makedirs(self.path, exist_ok=True)
+        self._write(os.path.join(self.path, "url.txt"), base_url.encode("utf-8"))
+        npages_file = os.path.join(self.path, "npages.txt")
+        try:
+            with open(npages_file) as f:
+                saved_npages = int(f.read())
+        except (FileNotFoundError, ValueError):
+            saved_npages = None
+        if saved_npages is not None and saved_npages != npages:
+            print("Number of pages changed from %s to %s, discarding checkpoint" % (saved_npages, npages))
+            self.clear()
+        self._write(npages_file, str(npages).encode("utf-8"))
+
+    def _write(self, file, data):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, file)
+
+    def _file(self, page):
+        return os.path.join(self.path, "page%s.csv" % page)
+
+    def __contains__(self, page):
+        return os.path.exists(self._file(page))
+
+    def pages(self):
+        """Numbers of the saved pages.
+
+        Returns:
+            list: Sorted page numbers.
+        """
+        return sorted(
+            int(name[4:-4])
+            for name in os.listdir(self.path)
+            if name.startswith("page") and name.endswith(".csv")
+        )
+
+    def save(self, page, tab):
+        """Save a parsed page.
+
+        Args:
+            page (int): Page number.
+            tab (pd.DataFrame): Parsed page, from `HLAfreq.parseAF()`.
+        """
+        self._write(self._file(page), tab.to_csv(index=False).encode("utf-8"))
+
+    def load(self, page):
+        """Load a saved page.
+
+        Args:
+            page (int): Page number.
+
+        Returns:
+            pd.DataFrame: The page as returned by `HLAfreq.parseAF()`.
+        """
+        # Read as text to get exactly what parseAF() returned
+        return pd.read_csv(self._file(page), dtype=str, keep_default_na=False)
+
+    def clear(self):
+        """Remove all saved pages"""
+        for page in self.pages():
+            try:
+                os.remove(self._file(page))
+            except FileNotFoundError:
+                pass
+
+    def remove(self):
+        """Remove the checkpoint of this search, once its download is complete"""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+_cache = None
+
+
+def get_cache():
+    """Get the default cache used by downloads.
+
+    Returns:
+        ResponseCache: The default cache, or None if no default is set.
+    """
+    return _cache
+
+
+def set_cache(cache):
+    """Set the default cache used by downloads.
+
+    Args:
+        cache (ResponseCache): Cache to use by default, or None to stop caching.
+    """
+    global _cache
+    _cache = cache
@@ -0,0 +1,536 @@
+"""
+Allele frequencies as a study by allele matrix.
+
+Allele frequency data is downloaded in long format, one row per allele per
+study. Combining studies, fitting the Bayesian model, and calculating
+population coverage all need the same data as a matrix of studies by
+alleles. `AFMatrix` converts long format data to that matrix once, with
+aligned study and allele indexes, the sample size of each study, and the
+columns of each locus, so that later calculations are matrix operations.
+
+```
+from HLAfreq import HLAfreq_matrix
+afm = HLAfreq_matrix.AFMatrix.from_long(aftab)
+caf = HLAfreq.combineAF(afm)
+afm.coverage(["A*01:01", "A*02:01"])
+afm.to_frame()
+```
+
+`HLAfreq.combineAF()`, `HLAfreq.population_coverage()` and the
+`HLAfreq_pymc` functions accept an `AFMatrix` in place of long format data.
+`AFMatrix.to_long()` converts back to long format.
+
+At 3 or 4 field resolution a locus has thousands of alleles, but each study
+reports only a few of them. `SparseAFMatrix` stores only the reported
+alleles, as a `scipy.sparse` CSR matrix, and combines, validates and
+calculates coverage without filling in unreported alleles, so memory and
+time grow with the data reported rather than studies times alleles.
+
+```
+afm = HLAfreq_matrix.SparseAFMatrix.from_long(aftab)
+caf = HLAfreq.combineAF(afm)
+```
+"""
+
+import numpy as np
+import pandas as pd
+import scipy as sp
+import scipy.sparse
+import HLAfreq
+from HLAfreq import HLAfreq_allele, HLAfreq_validate
+
+
+def _whole(values):
+    """Values as integers if they are all whole numbers"""
+    if len(values) and np.all(np.isfinite(values)) and np.all(values == np.round(values)):
+        return values.astype(np.int64)
+    return values
+
+
+def _weight_factor(weights):
+    """Multiple of sample size used as `weights`"""
+    if weights == "2n":
+        return 2
+    if weights == "sample_size":
+        return 1
+    raise AssertionError("AFMatrix weights must be '2n' or 'sample_size', not %s" % weights)
+
+
+def _long_entries(AFtab, datasetID):
+    """Reported entries of long format data, and the matrix indexes.
+
+    Returns:
+        tuple: Row, column and frequency of each entry, the studies, alleles
+            and locus of each allele, and the sample size of each study and
+            locus.
+    """
+    study, studies = pd.factorize(AFtab[datasetID], sort=True)
+    allele, alleles = pd.factorize(AFtab.allele, sort=True)
+    keep = (study >= 0) & (allele >= 0)
+    study, allele = study[keep], allele[keep]
+    freqs = AFtab.allele_freq.to_numpy(dtype=np.float64)[keep]
+    sizes = AFtab.sample_size.to_numpy(dtype=np.float64)[keep]
+    # Locus of each distinct allele
+    allele_loci = np.empty(len(alleles), dtype=object)
+    allele_loci[allele] = AFtab.loci.to_numpy(dtype=object)[keep]
+    locus, loci = pd.factorize(allele_loci, sort=True)
+    # Order columns by locus, then allele
+    order = np.lexsort((np.arange(len(alleles)), locus))
+    column = np.empty(len(alleles), dtype=np.int64)
+    column[order] = np.arange(len(alleles))
+    column = column[allele]
+    if np.bincount(study * len(alleles) + column).max(initial=0) > 1:
+        raise AssertionError("The same allele appears multiple times in a dataset")
+    row_locus = locus[allele]
+    sample_size = np.full((len(studies), len(loci)), np.nan)
+    sample_size[study, row_locus] = sizes
+    stored = sample_size[study, row_locus]
+    if not np.all((stored == sizes) | (np.isnan(stored) & np.isnan(sizes))):
+        raise AssertionError("Each study must have one sample_size for each locus")
+    return (
+        study,
+        column,
+        freqs,
+        np.asarray(studies),
+        np.asarray(alleles, dtype=object)[order],
+        allele_loci[order],
+        sample_size,
+    )
+
+
+class AFMatrix:
+    """Allele frequencies of studies (rows) by alleles (columns).
+
+    Alleles are grouped by locus, the columns of each locus are in `blocks`.
+    Usually created from long format data with `AFMatrix.from_long()`.
+
+    Args:
+        freq (np.ndarray): Allele frequency of each study and allele, NaN where
+            the study didn't report the allele.
+        studies (list): Study of each row.
+        alleles (list): Allele of each column, grouped by locus.
+        loci (list): Locus of each allele.
+        sample_size (np.ndarray): Sample size of each study (rows) for each
+            locus (columns, in order of first appearance in `loci`), NaN where
+            the study didn't report the locus.
+        datasetID (str, optional): Name of the study identifier, used as the
+            column name in long format. Defaults to 'population'.
+
+    Attributes:
+        freq (np.ndarray): Allele frequencies, studies by alleles.
+        sample_size (np.ndarray): Sample sizes, studies by loci.
+        studies (pd.Index): Study of each row.
+        alleles (pd.Index): Allele of each column.
+        allele_loci (np.ndarray): Locus of each column.
+        loci (pd.Index): Distinct loci, the columns of `sample_size`.
+        blocks (dict): Locus to slice of its allele columns.
+    """
+
+    def __init__(self, freq, studies, alleles, loci, sample_size, datasetID="population"):
+        self.freq = np.asarray(freq, dtype=np.float64)
+        self._index(studies, alleles, loci, sample_size, datasetID)
+
+    def _index(self, studies, alleles, loci, sample_size, datasetID):
+        """Set and check the indexes of `freq`"""
+        self.sample_size = np.asarray(sample_size, dtype=np.float64)
+        self.studies = pd.Index(studies, name=datasetID)
+        self.alleles = pd.Index(alleles, name="allele")
+        self.allele_loci = np.asarray(loci, dtype=object)
+        self.datasetID = datasetID
+        if self.freq.shape != (len(self.studies), len(self.alleles)):
+            raise AssertionError(
+                "freq must be studies by alleles %s, not %s"
+                % ((len(self.studies), len(self.alleles)), self.freq.shape)
+            )
+        if len(self.allele_loci) != len(self.alleles):
+            raise AssertionError("loci must give the locus of each allele")
+        self.loci = pd.Index(pd.unique(self.allele_loci), name="loci")
+        if self.sample_size.shape != (len(self.studies), len(self.loci)):
+            raise AssertionError(
+                "sample_size must be studies by loci %s, not %s"
+                % ((len(self.studies), len(self.loci)), self.sample_size.shape)
+            )
+        # Columns of each locus must be adjacent
+        starts = np.flatnonzero(np.r_[True, self.allele_loci[1:] != self.allele_loci[:-1]])
+        if len(starts) != len(self.loci):
+            raise AssertionError("Alleles must be grouped by locus")
+        ends = np.r_[starts[1:], len(self.alleles)]
+        self.blocks = {
+            locus: slice(int(start), int(end))
+            for locus, start, end in zip(self.loci, starts, ends)
+        }
+
+    @classmethod
+    def from_long(cls, AFtab, datasetID="population", format=True, ignoreG=True):
+        """Create a matrix from long format allele frequency data.
+
+        Studies are sorted, and alleles sorted by locus and then allele, as by
+        `HLAfreq.combineAF()`. Rows missing a study or allele are dropped.
+
+        Args:
+            AFtab (pd.DataFrame): Allele frequency data, one row per allele per study.
+            datasetID (str, optional): Unique identifier column for study.
+                Defaults to 'population'.
+            format (bool, optional): Run `HLAfreq.formatAF()`. Defaults to True.
+            ignoreG (bool, optional): Treat allele G groups as normal, see
+                `HLAfreq.formatAF()`. Defaults to True.
+
+        Returns:
+            AFMatrix: Allele frequencies of each study and allele.
+        """
+        if format and not HLAfreq.is_formatted(AFtab):
+            AFtab = HLAfreq.formatAF(AFtab, ignoreG)
+        return cls._from_entries(*_long_entries(AFtab, datasetID), datasetID)
+
+    @classmethod
+    def _from_entries(
+        cls, study, column, freqs, studies, alleles, loci, sample_size, datasetID
+    ):
+        freq = np.full((len(studies), len(alleles)), np.nan)
+        freq[study, column] = freqs
+        return cls(freq, studies, alleles, loci, sample_size, datasetID)
+
+    def _entries(self):
+        """Row, column and frequency of each reported allele, in row order"""
+        study, column = np.nonzero(self.measured)
+        return study, column, self.freq[study, column]
+
+    def _convert(self, cls):
+        """Same data stored as `cls`"""
+        return cls._from_entries(
+            *self._entries(), self.studies, self.alleles, self.allele_loci,
+            self.sample_size, self.datasetID,
+        )
+
+    def to_sparse(self):
+        """Store only reported alleles.
+
+        Returns:
+            SparseAFMatrix: The same allele frequencies.
+        """
+        return self._convert(SparseAFMatrix)
+
+    @property
+    def measured(self):
+        """True where a study reported an allele, studies by alleles"""
+        return ~np.isnan(self.freq)
+
+    def allele_sample_size(self):
+        """Sample size of each study for the locus of each allele, studies by alleles"""
+        return self.sample_size[:, self._column_loci()]
+
+    def _column_loci(self):
+        """Position in `loci` of the locus of each allele"""
+        return self.loci.get_indexer(self.allele_loci)
+
+    def block(self, locus):
+        """Matrix of a single locus, only the studies that reported it.
+
+        Args:
+            locus (str): Locus to select.
+
+        Returns:
+            AFMatrix: Allele frequencies of `locus`, of the same type as this matrix.
+        """
+        if locus not in self.blocks:
+            raise AssertionError("No alleles of locus %s" % locus)
+        columns = self.blocks[locus]
+        i = self.loci.get_loc(locus)
+        rows = ~np.isnan(self.sample_size[:, i])
+        return type(self)(
+            self.freq[rows][:, columns],
+            self.studies[rows],
+            self.alleles[columns],
+            self.allele_loci[columns],
+            self.sample_size[rows, i : i + 1],
+            self.datasetID,
+        )
+
+    def fill_unmeasured(self):
+        """Add unreported alleles with frequency zero, as `HLAfreq.unmeasured_alleles()`.
+
+        Only alleles of loci that a study reported are added.
+
+        Returns:
+            AFMatrix: Copy with all locus alleles reported for each study.
+        """
+        studied = ~np.isnan(self.allele_sample_size())
+        freq = np.where(studied & np.isnan(self.freq), 0.0, self.freq)
+        return AFMatrix(
+            freq, self.studies, self.alleles, self.allele_loci,
+            self.sample_size, self.datasetID,
+        )
+
+    def weights(self, weights="2n"):
+        """Weight of each study and allele, 0 where the allele wasn't reported.
+
+        Args:
+            weights (str, optional): '2n' for twice the sample size, or
+                'sample_size'. Defaults to '2n'.
+
+        Returns:
+            np.ndarray: Weights, studies by alleles.
+        """
+        w = self.allele_sample_size() * _weight_factor(weights)
+        return np.where(self.measured, w, 0.0)
+
+    def observations(self, weights="2n"):
+        """Observations of each allele in each study, `allele_freq * weights`.
+
+        Args:
+            weights (str, optional): See `weights()`. Defaults to '2n'.
+
+        Returns:
+            np.ndarray: Observations, studies by alleles, 0 where the allele
+                wasn't reported.
+        """
+        return np.where(self.measured, self.freq, 0.0) * self.weights(weights)
+
+    def _locus_sums(self, columns=None):
+        """Total frequency of each study and locus, of `columns` if given"""
+        freq = np.nan_to_num(self.freq)
+        if columns is not None:
+            freq = freq * columns
+        sums = np.zeros(self.sample_size.shape)
+        for i, block in enumerate(self.blocks.values()):
+            sums[:, i] = freq[:, block].sum(axis=1)
+        return sums
+
+    def _allele_counts(self):
+        """Number of studies reporting each allele"""
+        return self.measured.sum(axis=0)
+
+    def _allele_totals(self, weights, add_unmeasured):
+        """Observations, total weight and total sample size of each allele"""
+        afm = self.fill_unmeasured() if add_unmeasured else self
+        w = afm.weights(weights)
+        c = afm.observations(weights).sum(axis=0)
+        sample_size = np.where(afm.measured, afm.allele_sample_size(), 0.0).sum(axis=0)
+        return c, w.sum(axis=0), sample_size
+
+    def validate(self, llimit=0.95, ulimit=1.1):
+        """Check the matrix can be combined, as `HLAfreq_validate.validate()`.
+
+        Args:
+            llimit (float, optional): Lower allele_freq sum limit that counts as
+                complete. Defaults to 0.95.
+            ulimit (float, optional): Upper allele_freq sum limit that counts as
+                complete. Defaults to 1.1.
+
+        Returns:
+            HLAfreq_validate.ValidationReport: Results of all checks.
+        """
+        study, locus = np.nonzero(~np.isnan(self.sample_size))
+        totals = pd.Series(
+            self._locus_sums()[study, locus],
+            index=pd.MultiIndex.from_arrays(
+                [self.studies[study], self.loci[locus]], names=[self.datasetID, "loci"]
+            ),
+            name="allele_freq",
+        ).sort_index()
+        duplicated = pd.Series(
+            [],
+            index=pd.MultiIndex.from_arrays([[], []], names=[self.datasetID, "allele"]),
+            name="size",
+            dtype=np.int64,
+        )
+        resolution = HLAfreq_allele.resolution(pd.Series(self.alleles, name="allele"))
+        resolutions = (
+            pd.Series(self._allele_counts())
+            .groupby(resolution.to_numpy())
+            .sum()
+            .rename_axis("allele")
+            .rename("count")
+        )
+        resolutions = resolutions[resolutions > 0].sort_values(ascending=False, kind="stable")
+        return HLAfreq_validate.ValidationReport(
+            self.datasetID, llimit, ulimit, list(self.loci),
+            duplicated, totals, resolutions,
+        )
+
+    def combine(self, weights="2n", alpha=[], add_unmeasured=True):
+        """Combine allele frequencies of all studies, as `HLAfreq.combineAF()`.
+
+        Each locus is combined separately, with its own Dirichlet distribution.
+        Does not check the data, see `HLAfreq.combineAF()`.
+
+        Args:
+            weights (str, optional): See `weights()`. Defaults to '2n'.
+            alpha (list or dict, optional): Prior to use for Dirichlet distribution,
+                a list for all alleles in column order, or a dict of locus to
+                prior of that locus. Defaults to [], 1 observation of each allele.
+            add_unmeasured (bool, optional): Add unmeasured alleles to each study.
+                Defaults to True.
+
+        Returns:
+            pd.DataFrame: Combined allele frequencies, see `HLAfreq.combineAF()`.
+        """
+        c, weight, sample_size = self._allele_totals(weights, add_unmeasured)
+        combined = pd.DataFrame(
+            {
+                "allele": np.asarray(self.alleles, dtype=object),
+                "loci": self.allele_loci,
+                "wav": c / weight,
+                "c": c,
+                "sample_size": _whole(sample_size),
+            }
+        )
+        combined["alpha"] = HLAfreq.locus_prior(combined.loci, alpha)
+        # Calculate Dirichlet mean for each allele, separately for each locus
+        concentration = (combined.alpha + combined.c).to_numpy(dtype=np.float64)
+        allele_freq = np.empty(len(concentration))
+        for columns in self.blocks.values():
+            allele_freq[columns] = sp.stats.dirichlet(concentration[columns]).mean()
+        combined["allele_freq"] = allele_freq
+        return combined
+
+    def coverage(self, alleles=None):
+        """Proportion of people with at least 1 copy of any of `alleles`, assuming HWE.
+
+        Coverage is calculated for each locus and combined across loci, as
+        `1 - (1 - p_A)^2 * (1 - p_B)^2 ...` where `p_A` is the total frequency
+        of `alleles` at locus A.
+
+        Args:
+            alleles (list, optional): Alleles to calculate coverage of. Defaults
+                to None, all alleles.
+
+        Returns:
+            pd.Series: Coverage of each study.
+        """
+        columns = None if alleles is None else self.alleles.isin(alleles)
+        uncovered = np.prod((1 - self._locus_sums(columns)) ** 2, axis=1)
+        return pd.Series(1 - uncovered, index=self.studies, name="coverage")
+
+    def to_frame(self):
+        """Allele frequencies as a wide DataFrame of studies by alleles.
+
+        Returns:
+            pd.DataFrame: Allele frequencies, NaN where not reported.
+        """
+        return pd.DataFrame(self.freq, index=self.studies, columns=self.alleles)
+
+    def to_long(self):
+        """Allele frequencies in long format, one row per reported allele per study.
+
+        Returns:
+            pd.DataFrame: `allele`, `loci`, `datasetID`, `allele_freq` and
+                `sample_size` columns, in order of study and then allele.
+        """
+        study, column, freq = self._entries()
+        sample_size = self.sample_size[study, self._column_loci()[column]]
+        return pd.DataFrame(
+            {
+                "allele": np.asarray(self.alleles, dtype=object)[column],
+                "loci": self.allele_loci[column],
+                self.datasetID: np.asarray(self.studies)[study],
+                "allele_freq": freq,
+                "sample_size": _whole(sample_size),
+            }
+        )
+
+    def __repr__(self):
+        return "%s(%s studies, %s alleles, loci %s)" % (
+            type(self).__name__, len(self.studies), len(self.alleles), list(self.loci),
+        )
+
+
+class SparseAFMatrix(AFMatrix):
+    """Allele frequencies of studies by alleles, storing only reported alleles.
+
+    As `AFMatrix`, but `freq` is a `scipy.sparse.csr_matrix` whose stored
+    entries are the reported alleles, including any reported with frequency
+    zero. Combining, validation and coverage use only the stored entries.
+    `fill_unmeasured()`, `weights()` and `observations()` return dense
+    results, as needed by `HLAfreq_pymc`.
+
+    Args:
+        freq (scipy.sparse matrix): Allele frequency of each reported study and allele.
+        studies (list): Study of each row.
+        alleles (list): Allele of each column, grouped by locus.
+        loci (list): Locus of each allele.
+        sample_size (np.ndarray): Sample size of each study and locus, see `AFMatrix`.
+        datasetID (str, optional): Name of the study identifier. Defaults to
+            'population'.
+    """
+
+    def __init__(self, freq, studies, alleles, loci, sample_size, datasetID="population"):
+        self.freq = scipy.sparse.csr_matrix(freq, dtype=np.float64)
+        self.freq.sort_indices()
+        self._index(studies, alleles, loci, sample_size, datasetID)
+
+    @classmethod
+    def _from_entries(
+        cls, study, column, freqs, studies, alleles, loci, sample_size, datasetID
+    ):
+        freq = scipy.sparse.csr_matrix(
+            (freqs, (study, column)), shape=(len(studies), len(alleles))
+        )
+        return cls(freq, studies, alleles, loci, sample_size, datasetID)
+
+    def _entries(self):
+        study = np.repeat(np.arange(self.freq.shape[0]), np.diff(self.freq.indptr))
+        return study, self.freq.indices, self.freq.data
+
+    def todense(self):
+        """Store all alleles of all studies.
+
+        Returns:
+            AFMatrix: The same allele frequencies.
+        """
+        return self._convert(AFMatrix)
+
+    @property
+    def measured(self):
+        """True where a study reported an allele, as a sparse matrix"""
+        measured = self.freq.copy()
+        measured.data = np.ones(len(measured.data), dtype=bool)
+        return measured
+
+    def fill_unmeasured(self):
+        """Dense matrix with unreported alleles added, see `AFMatrix.fill_unmeasured()`"""
+        return self.todense().fill_unmeasured()
+
+    def weights(self, weights="2n"):
+        """Dense weights, see `AFMatrix.weights()`"""
+        return self.todense().weights(weights)
+
+    def observations(self, weights="2n"):
+        """Dense observations, see `AFMatrix.observations()`"""
+        return self.todense().observations(weights)
+
+    def _locus_sums(self, columns=None):
+        study, column, freq = self._entries()
+        if columns is not None:
+            freq = freq * columns[column]
+        key = study * len(self.loci) + self._column_loci()[column]
+        sums = np.bincount(key, np.nan_to_num(freq), minlength=self.sample_size.size)
+        return sums.reshape(self.sample_size.shape)
+
+    def _allele_counts(self):
+        return np.bincount(self.freq.indices, minlength=len(self.alleles))
+
+    def _allele_totals(self, weights, add_unmeasured):
+        study, column, freq = self._entries()
+        factor = _weight_factor(weights)
+        column_loci = self._column_loci()
+        sizes = self.sample_size[study, column_loci[column]]
+        n = len(self.alleles)
+        c = np.bincount(column, freq * (sizes * factor), minlength=n)
+        if add_unmeasured:
+            # Unreported alleles add no observations, but every study of the
+            # locus adds its sample size
+            sample_size = np.nansum(self.sample_size, axis=0)[column_loci]
+        else:
+            sample_size = np.bincount(column, sizes, minlength=n)
+        return c, sample_size * factor, sample_size
+
+    def to_frame(self):
+        """Allele frequencies as a sparse wide DataFrame of studies by alleles.
+
+        Returns:
+            pd.DataFrame: Allele frequencies, 0 where not reported.
+        """
+        return pd.DataFrame.sparse.from_spmatrix(
+            self.freq, index=self.studies, columns=self.alleles
+        )
@@ -0,0 +1,202 @@
+"""
+Fast extraction of results from allelefrequencies.net pages.
+
+Only two regions of a results page are used, the allele frequency table in
+`divGenDetail` and the page count in `divGenNavig`. Rather than building a
+full BeautifulSoup tree of the page, these regions are located with regular
+expressions and only they are tokenized with the standard library
+`html.parser`. Cell text follows BeautifulSoup's `get_text()` so results
+match parsing with BeautifulSoup. These functions are used by
+`HLAfreq.parseAF()` and `HLAfreq.Npages()` when they are given page text.
+"""
+
+import re
+from html.parser import HTMLParser
+
+# Strings inside these tags are not returned by BeautifulSoup's get_text()
+_IGNORED_TEXT = {"script", "style", "template"}
+_TABLE_TAG = re.compile(r"<(/?)table\b", re.IGNORECASE)
+_DIV_TAG = re.compile(r"<(/?)div\b", re.IGNORECASE)
+
+
+class _TableParser(HTMLParser):
+    """Collect the text of every `td` in every `tr` of an html table.
+
+    As with BeautifulSoup's `find_all()`, nested cells belong to all enclosing
+    rows and a cell's text includes the text of nested elements. `cells` lists
+    every `td` once, in document order.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.cells = []
+        self._open = []
+        self._ignore = 0
+        self._data = []
+
+    def _flush(self):
+        # Consecutive data calls are one string, as in BeautifulSoup
+        if not self._data:
+            return
+        string = "".join(self._data)
+        self._data = []
+        if self._ignore:
+            return
+        for tag, item in self._open:
+            if tag == "td":
+                item.append(string)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in _IGNORED_TEXT:
+            self._ignore += 1
+        elif tag == "tr":
+            row = []
+            self.rows.append(row)
+            self._open.append(("tr", row))
+        elif tag == "td":
+            cell = []
+            self.cells.append(cell)
+            for open_tag, row in self._open:
+                if open_tag == "tr":
+                    row.append(cell)
+            self._open.append(("td", cell))
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in _IGNORED_TEXT:
+            self._ignore = max(0, self._ignore - 1)
+        elif tag in ("tr", "td"):
+            # Close the most recent matching tag and any left open inside it
+            for i in range(len(self._open) - 1, -1, -1):
+                if self._open[i][0] == tag:
+                    del self._open[i:]
+                    break
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _element_end(text, start, tags):
+    """End of the element starting at `start`, allowing for nested elements.
+
+    Args:
+        text (str): html page text.
+        start (int): Position of the element's start tag.
+        tags (re.Pattern): Matches the element's start and end tags, with the
+            "/" of end tags as group 1.
+
+    Returns:
+        int: Position after the element's end tag, or the end of `text` if it
+            isn't closed.
+    """
+    depth = 0
+    for tag in tags.finditer(text, start):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return text.find(">", tag.end()) + 1
+    return len(text)
+
+
+def _find_table(text, div_id, table_class):
+    """Get the html of the first table of class `table_class` in div `div_id`.
+
+    Args:
+        text (str): html page text.
+        div_id (str): id of the div containing the table.
+        table_class (str): class of the table.
+
+    Returns:
+        str: html of the table, or None if the div is missing.
+            An empty string if the div has no such table.
+    """
+    div = re.search(
+        r"<div\b[^>]*\bid\s*=\s*[\"']?%s[\"'\s>]" % re.escape(div_id),
+        text,
+        re.IGNORECASE,
+    )
+    if not div:
+        return None
+    # Only search within the div
+    table = re.compile(
+        r"<table\b[^>]*\bclass\s*=\s*[\"']?(?:[^\"'>]*\s)?%s[\"'\s>]"
+        % re.escape(table_class),
+        re.IGNORECASE,
+    ).search(text, div.start(), _element_end(text, div.start(), _DIV_TAG))
+    if not table:
+        return ""
+    return text[table.start(): _element_end(text, table.start(), _TABLE_TAG)]
+
+
+def _parse_table(html):
+    parser = _TableParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def _strip(cell):
+    """Cell text as returned by BeautifulSoup's `get_text(strip=True)`"""
+    return "".join(s.strip() for s in cell)
+
+
+def AF_rows(text):
+    """Extract the allele frequency table from a results page.
+
+    Args:
+        text (str): html of an allelefrequencies.net results page.
+
+    Returns:
+        list: For each row of the `divGenDetail` results table, a list of the
+            text of each `td`. The header row of `th` cells is an empty list.
+    """
+    html = _find_table(text, "divGenDetail", "tblNormal")
+    if html is None:
+        raise AttributeError("Results page has no divGenDetail, check the URL")
+    if not html:
+        raise AttributeError("divGenDetail has no results table, check the URL")
+    return [[_strip(cell) for cell in row] for row in _parse_table(html).rows]
+
+
+def page_count(text):
+    """Extract the total number of results pages from a results page.
+
+    Args:
+        text (str): html of an allelefrequencies.net results page.
+
+    Returns:
+        int: Total number of results pages
+    """
+    html = _find_table(text, "divGenNavig", "table10")
+    if html is None:
+        raise AttributeError("Results page has no divGenNavig, check the URL")
+    if not html:
+        raise AssertionError("navtab does not evaluate to True. Check URL returns results in web browser.")
+    # Get cell with ' of ' in
+    pagesOfN = [
+        _strip(cell) for cell in _parse_table(html).cells if " of " in "".join(cell)
+    ]
+    # Check single cell returned
+    if not len(pagesOfN) == 1:
+        raise AssertionError("divGenNavig should contain 1 of not %s" % len(pagesOfN))
+    # Get total number of pages
+    N = pagesOfN[0].split("of ")[1]
+    N = int(N)
+    return N
@@ -0,0 +1,249 @@
+"""
+Plan many overlapping searches so each study is downloaded once.
+
+Searches often overlap: a region and the countries within it, or a search
+with no locus and the same search for each locus, return the same
+studies. `plan()` splits each search into shards of a single locus and a
+single country, and shards that are the same search are only downloaded
+once. `getAFplanned()` downloads the shards in parallel with
+`HLAfreq.getAFbatch()`, saving each to a `ShardStore` so that later plans
+only download shards that aren't stored yet, and rebuilds each search from
+its shards.
+
+```
+from HLAfreq import HLAfreq_plan
+countries = pd.read_csv("countries.csv")
+queries = {
+    "EA": {"region": "Sub-Saharan Africa"},
+    "UG_A": {"country": "Uganda", "locus": "A"},
+}
+aftabs, status = HLAfreq_plan.getAFplanned(
+    queries, store="data/shards", loci=["A", "B", "C"], countries=countries
+)
+```
+
+A region is split into the countries in `countries` for that region. A
+search with no locus is split into `loci`, which must be given for such
+searches as there is no complete list of loci to split into, so the
+rebuilt search only has the loci in `loci`, unlike the website's search.
+A search with neither a country nor a region is split by locus only. Rows of a rebuilt search are in order
+of its shards, not the order the website returns them.
+"""
+
+import hashlib
+import os
+import tempfile
+import pandas as pd
+import HLAfreq
+from HLAfreq import HLAfreq_data
+
+class ShardStore:
+    """Downloaded shards of searches saved to disk.
+
+    Each shard is saved as csv, named by a hash of its search URL, as parsed
+    and before formatting so that loading it returns exactly what was
+    downloaded.
+
+    Args:
+        path (str): Directory to store shards in, created if needed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, key + ".csv")
+
+    def __contains__(self, url):
+        return os.path.exists(self._file(url))
+
+    def save(self, url, tab):
+        """Save the unformatted allele frequency data of a shard.
+
+        Args:
+            url (str): Search URL of the shard.
+            tab (pd.DataFrame): Allele frequency data from
+                `HLAfreq.getAFdata(url, format=False)`.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(tab.to_csv(index=False).encode("utf-8"))
+        os.replace(tmp, self._file(url))
+
+    def load(self, url):
+        """Load the unformatted allele frequency data of a shard.
+
+        Args:
+            url (str): Search URL of the shard.
+
+        Returns:
+            pd.DataFrame: Allele frequency data as saved.
+        """
+        return pd.read_csv(self._file(url), dtype=str, keep_default_na=False)
+
+
+def _regions_countries(countries):
+    """Dictionary of region to list of countries"""
+    if countries is None:
+        countries = HLAfreq_data.load_countries()
+    return countries.groupby("Region", sort=False).Country.apply(list).to_dict()
+
+
+def plan(queries, loci=None, countries=None):
+    """Split searches into shards of a single locus and country.
+
+    Args:
+        queries (dict or list): Searches as dictionaries of `HLAfreq.makeURL()`
+            arguments. If a dict, keys are used as query names, if a list the
+            position in the list is used.
+        loci (list, optional): Loci to split searches without a locus into,
+            required if any search has no locus. Other loci of these searches are
+            not downloaded. Defaults to None.
+        countries (pd.DataFrame, optional): `Country` and `Region` of each country,
+            used to split regions into countries. Defaults to
+            `HLAfreq_data.load_countries()`, only loaded if a query has a region.
+
+    Returns:
+        tuple: Dictionary of shard URL to its `makeURL()` arguments, each
+            distinct shard once, and dictionary of query name to list of
+            URLs of its shards.
+    """
+    if not isinstance(queries, dict):
+        queries = dict(enumerate(queries))
+    regions = None
+    shards = {}
+    members = {}
+    for name, query in queries.items():
+        if not isinstance(query, dict):
+            raise AssertionError(
+                "queries must be dictionaries of makeURL() arguments, not %s" % (query,)
+            )
+        query = dict(query)
+        parts = [query]
+        if query.get("region") and not query.get("country"):
+            if regions is None:
+                regions = _regions_countries(countries)
+            if query["region"] not in regions:
+                raise AssertionError("No countries in region %s" % query["region"])
+            parts = [
+                dict(query, region="", country=country)
+                for country in regions[query["region"]]
+            ]
+        if not query.get("locus"):
+            if not loci:
+                raise AssertionError(
+                    "Query %s has no locus, give the loci to split it into" % (name,)
+                )
+            parts = [dict(part, locus=locus) for part in parts for locus in loci]
+        members[name] = []
+        for part in parts:
+            url = HLAfreq.makeURL(**part)
+            shards.setdefault(url, part)
+            members[name].append(url)
+    return shards, members
+
+
+def getAFplanned(
+    queries,
+    store=None,
+    loci=None,
+    countries=None,
+    workers=4,
+    timeout=20,
+    format=True,
+    ignoreG=True,
+    session=None,
+    cache=None,
+):
+    """Get allele frequency data for many overlapping searches.
+
+    Searches are split into shards with `plan()`, shards not in `store` are
+    downloaded with `HLAfreq.getAFbatch()`, and each search is rebuilt from
+    its shards.
+
+    Args:
+        queries (dict or list): Searches as dictionaries of `HLAfreq.makeURL()`
+            arguments, see `plan()`.
+        store (str or ShardStore, optional): Store of downloaded shards, shards
+            already stored are not downloaded again. Defaults to None, keep
+            shards in memory only.
+        loci (list, optional): Loci to split searches without a locus into,
+            required if any search has no locus, see `plan()`. Defaults to None.
+        countries (pd.DataFrame, optional): `Country` and `Region` of each country,
+            see `plan()`.
+        workers (int, optional): Number of pages to download at once. Defaults to 4.
+        timeout (int, optional): How long to wait to receive a response.
+            Defaults to 20.
+        format (bool, optional): Format the data using `HLAfreq.formatAF()`.
+            Defaults to True.
+        ignoreG (bool, optional): treat allele G groups as normal. Defaults to True.
+        session (requests.Session, optional): Session to download with. Defaults
+            to the shared session, see `HLAfreq_session`.
+        cache (HLAfreq_cache.ResponseCache, optional): On disk cache of downloaded
+            pages, see `HLAfreq.getAFdata()`.
+
+    Returns:
+        tuple: Dictionary of query name to pd.DataFrame of allele frequency data,
+            and a pd.DataFrame status report indexed by query name with the
+            number of `shards`, how many were `downloaded` now, `status`
+            ("complete", "partial" if some shards failed, or "failed"), and
+            `error` listing failed shards. Queries that failed completely are
+            not in the allele frequency data.
+    """
+    if isinstance(store, str):
+        store = ShardStore(store)
+    shards, members = plan(queries, loci, countries)
+    tabs = {}
+    if store is not None:
+        for url in shards:
+            if url in store:
+                tabs[url] = store.load(url)
+    missing = [url for url in shards if url not in tabs]
+    n_members = sum(len(urls) for urls in members.values())
+    print(
+        "%s queries, %s shards, %s distinct, %s to download"
+        % (len(members), n_members, len(shards), len(missing))
+    )
+    errors = {}
+    if missing:
+        downloaded, batch_status = HLAfreq.getAFbatch(
+            missing,
+            workers=workers,
+            timeout=timeout,
+            format=False,
+            session=session,
+            cache=cache,
+        )
+        for i, url in enumerate(missing):
+            if i in downloaded:
+                tabs[url] = downloaded[i]
+                if store is not None:
+                    store.save(url, downloaded[i])
+            else:
+                errors[url] = batch_status.error[i]
+    results = {}
+    status = {}
+    for name, urls in members.items():
+        failed = [url for url in urls if url in errors]
+        status[name] = {
+            "shards": len(urls),
+            "downloaded": len([url for url in urls if url in missing]) - len(failed),
+            "status": "complete",
+            "error": "; ".join("%s: %s" % (url, errors[url]) for url in failed),
+        }
+        if len(failed) == len(urls):
+            status[name]["status"] = "failed"
+            continue
+        if failed:
+            status[name]["status"] = "partial"
+        tab = pd.concat([tabs[url] for url in urls if url in tabs], ignore_index=True)
+        if format:
+            try:
+                tab = HLAfreq.formatAF(tab, ignoreG, inplace=True)
+            except AttributeError:
+                print("Formatting failed for %s, non-numeric datatypes may remain." % (name,))
+        results[name] = tab
+    status = pd.DataFrame.from_dict(status, orient="index")
+    return results, status
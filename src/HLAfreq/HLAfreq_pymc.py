@@ -9,6 +9,7 @@ import numpy as np
 import arviz as az
 import pandas as pd
 import HLAfreq
+from HLAfreq import HLAfreq_validate, HLAfreq_matrix
 
 
 def _make_c_array(
@@ -22,19 +23,17 @@ def _make_c_array(
     resolution=True,
     unique=True,
 ):
+    if isinstance(AFtab, HLAfreq_matrix.AFMatrix):
+        AFtab.validate().check(complete=complete, resolution=resolution)
+        if add_unmeasured:
+            AFtab = AFtab.fill_unmeasured()
+        return AFtab.observations(weights), list(AFtab.alleles)
+    if format and not HLAfreq.is_formatted(AFtab):
+        AFtab = HLAfreq.formatAF(AFtab, ignoreG)
+    # Same checks as combineAF(), in one pass
+    report = HLAfreq_validate.validate(AFtab, datasetID=datasetID)
+    report.check(unique=unique, complete=complete, resolution=resolution)
     df = AFtab.copy()
-    HLAfreq.single_loci(df)
-    if unique:
-        if not HLAfreq.alleles_unique_in_study(df, datasetID=datasetID):
-            raise AssertionError("The same allele appears multiple times in a dataset")
-    if complete:
-        if not HLAfreq.incomplete_studies(df, datasetID=datasetID).empty:
-            raise AssertionError("AFtab contains studies with AF that doesn't sum to 1. Check incomplete_studies(AFtab)")
-    if resolution:
-        if not HLAfreq.check_resolution(df):
-            raise AssertionError("AFtab conains alleles at multiple resolutions, check check_resolution(AFtab)")
-    if format:
-        df = HLAfreq.formatAF(df, ignoreG)
     if add_unmeasured:
         df = HLAfreq.unmeasured_alleles(df, datasetID)
     try:
@@ -45,13 +44,13 @@ def _make_c_array(
 
     # Sort by alleles so it matches the combined alleles
     df = df.sort_values("allele")
-    c_array = np.array(df.groupby(datasetID).c.apply(list).tolist())
+    c_array = np.array(df.groupby(datasetID, observed=True).c.apply(list).tolist())
     allele_names = sorted(df.allele.unique())
     # Imperfect check that allele order matches between caf and c_array.
     # caf is sorted automatically so should match sorted AFloc
     # Therefore we check that sorted AFloc matches c_array
     # The check is that the sum of allele i is the same
-    for a, b in zip(np.apply_along_axis(sum, 0, c_array), df.groupby("allele").c.sum()):
+    for a, b in zip(np.apply_along_axis(sum, 0, c_array), df.groupby("allele", observed=True).c.sum()):
         if not math.isclose(a, b):
             raise AssertionError("Error making c_array sum of single allele"
                                  "frequency differs between c_array and AFloc")
@@ -109,7 +108,8 @@ def AFhdi(
     by a latent, lognormal variable `conc`.
 
     Args:
-        AFtab (pd.DataFrame): Table of allele frequency data
+        AFtab (pd.DataFrame): Table of allele frequency data, or an
+            `HLAfreq_matrix.AFMatrix`.
         weights (str, optional): Column to be weighted by allele frequency to generate
             concentration parameter of Dirichlet distribution. Defaults to '2n'.
         datasetID (str, optional): Unique identifier column for study. Defaults to
@@ -0,0 +1,158 @@
+"""
+Shared HTTP session used for all downloads from allelefrequencies.net.
+
+A single `requests.Session` keeps connections to the server alive between
+pages, retries failed requests with exponential backoff, and optionally
+limits how many requests per second are sent to each host. All download
+functions in `HLAfreq` use `get_session()` unless a session is passed
+explicitly. Change the settings with `configure_session()`, e.g.
+
+```
+from HLAfreq import HLAfreq_session
+HLAfreq_session.configure_session(retries=5, rate_limit=2)
+```
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RateLimiter:
+    """Limit the number of requests per second sent to each host.
+
+    Thread safe, so a single limiter can be shared by concurrent downloads.
+
+    Args:
+        rate_limit (float, optional): Maximum requests per second per host.
+            `None` applies no limit. Defaults to None.
+    """
+
+    def __init__(self, rate_limit=None):
+        if rate_limit is not None and not rate_limit > 0:
+            raise AssertionError("rate_limit must be > 0 or None, not %s" % rate_limit)
+        self.rate_limit = rate_limit
+        self._next_request = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until a request to the host of `url` is allowed."""
+        if self.rate_limit is None:
+            return
+        host = urlparse(url).netloc
+        interval = 1 / self.rate_limit
+        # Reserve the next slot for this host, then sleep outside the lock
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request.get(host, now))
+            self._next_request[host] = slot + interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AFSession(requests.Session):
+    """`requests.Session` with connection pooling, retries, and rate limiting.
+
+    Args:
+        retries (int, optional): Number of times to retry a failed request.
+            Defaults to 3.
+        backoff_factor (float, optional): Retries wait
+            `backoff_factor * 2 ** (retry - 1)` seconds. Defaults to 0.5.
+        pool_size (int, optional): Number of connections kept alive per host,
+            should be at least the number of concurrent downloads. Defaults to 10.
+        rate_limit (float, optional): Maximum requests per second per host.
+            `None` applies no limit. Defaults to None.
+    """
+
+    def __init__(self, retries=3, backoff_factor=0.5, pool_size=10, rate_limit=None):
+        super().__init__()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.rate_limiter = RateLimiter(rate_limit)
+
+    def request(self, method, url, *args, **kwargs):
+        self.rate_limiter.wait(url)
+        return super().request(method, url, *args, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Get the shared session, creating it with default settings if needed.
+
+    Returns:
+        AFSession: Session used for all downloads.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = AFSession()
+        return _session
+
+
+def configure_session(retries=3, backoff_factor=0.5, pool_size=10, rate_limit=None):
+    """Replace the shared session with one using these settings.
+
+    Args:
+        retries (int, optional): Number of times to retry a failed request.
+            Defaults to 3.
+        backoff_factor (float, optional): Retries wait
+            `backoff_factor * 2 ** (retry - 1)` seconds. Defaults to 0.5.
+        pool_size (int, optional): Number of connections kept alive per host.
+            Defaults to 10.
+        rate_limit (float, optional): Maximum requests per second per host.
+            `None` applies no limit. Defaults to None.
+
+    Returns:
+        AFSession: The new shared session.
+    """
+    global _session
+    session = AFSession(
+        retries=retries,
+        backoff_factor=backoff_factor,
+        pool_size=pool_size,
+        rate_limit=rate_limit,
+    )
+    with _session_lock:
+        old, _session = _session, session
+    if old is not None:
+        old.close()
+    return session
+
+
+def get(url, timeout=20, session=None):
+    """GET `url` with the shared session.
+
+    Args:
+        url (str): URL to download.
+        timeout (int, optional): How long to wait to receive a response.
+            Defaults to 20.
+        session (requests.Session, optional): Session to use instead of the
+            shared session. Defaults to None.
+
+    Returns:
+        requests.Response: The server response.
+    """
+    if session is None:
+        session = get_session()
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response
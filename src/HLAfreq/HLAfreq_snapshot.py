@@ -0,0 +1,315 @@
+"""
+Local snapshot of the allele frequency database.
+
+Download the allele frequency data of many countries and loci once with
+`build_snapshot()` and store it as a Parquet dataset partitioned by locus
+and country. `query_snapshot()` takes the same arguments as
+`HLAfreq.makeURL()` but filters the snapshot locally, reading only the
+partitions and row groups that match, rather than downloading a new search.
+
+```
+from HLAfreq import HLAfreq_snapshot
+HLAfreq_snapshot.build_snapshot("data/snapshot", loci=["A", "B", "C"])
+aftab = HLAfreq_snapshot.query_snapshot("data/snapshot", region="South Asia", locus="A")
+```
+
+Downloaded results only describe alleles and populations, so some search
+filters can't be applied locally unless the snapshot records them.
+`country`, `region`, `locus`, `resolution` and `sample_size` are always
+available. Categorical filters such as `ethnic`, `study_type` and
+`dataset_source` are available if the snapshot was built with matching
+`tags`. `sample_year` filters are not available and raise an
+AssertionError, search allelefrequencies.net for them instead.
+
+Requires `pyarrow`, install with `pip install HLAfreq[snapshot]`.
+"""
+
+import json
+import operator
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import HLAfreq
+from HLAfreq import HLAfreq_data
+
+_METADATA = "_snapshot.json"
+_COLUMNS = ["allele", "loci", "population", "allele_freq", "carriers%", "sample_size"]
+_PATTERNS = {
+    "equal": operator.eq,
+    "different": operator.ne,
+    "less_than": operator.lt,
+    "bigger_than": operator.gt,
+    "less_equal_than": operator.le,
+    "bigger_equal_than": operator.ge,
+}
+# makeURL() arguments that can be recorded with `tags`
+TAGGABLE = ["ethnic", "study_type", "dataset_source"]
+# Joins the values of a tag matched by one population
+_SEPARATOR = "|"
+
+
+def _compare(column, pattern, value):
+    """Filter expression comparing `column` to `value` with a makeURL() pattern"""
+    if pattern not in _PATTERNS:
+        raise AssertionError(
+            "pattern must be one of %s, not %s" % (list(_PATTERNS), pattern)
+        )
+    return _PATTERNS[pattern](ds.field(column), value)
+
+
+def _countries_regions(countries):
+    """Dictionary of country to region from a list or table of countries"""
+    if countries is None:
+        countries = HLAfreq_data.load_countries()
+    if isinstance(countries, pd.DataFrame):
+        return dict(zip(countries.Country, countries.Region))
+    return {country: "" for country in countries}
+
+
+def write_snapshot(AFtab, path, standard="s", tags=None):
+    """Write allele frequency data to a snapshot.
+
+    Partitions of the snapshot for the loci and countries in `AFtab` are
+    replaced, other partitions are kept. So a snapshot can be written in
+    several parts, e.g. one region at a time.
+
+    Args:
+        AFtab (pd.DataFrame): Formatted allele frequency data with `country` and
+            `region` columns, and a column for each of `tags`.
+        path (str): Directory of the snapshot.
+        standard (str, optional): Study quality standard the data was downloaded
+            with, see `HLAfreq.makeURL()`. Defaults to "s".
+        tags (list, optional): Names of tag columns in `AFtab`, see
+            `build_snapshot()`. Defaults to None.
+    """
+    tags = list(tags or [])
+    metadata_file = os.path.join(path, _METADATA)
+    if os.path.exists(metadata_file):
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+        if not metadata["standard"] == standard:
+            raise AssertionError(
+                "Snapshot %s has standard %s, not %s" % (path, metadata["standard"], standard)
+            )
+        if not metadata["tags"] == tags:
+            raise AssertionError(
+                "Snapshot %s has tags %s, not %s" % (path, metadata["tags"], tags)
+            )
+    df = AFtab[_COLUMNS + ["country", "region"] + tags].copy()
+    df["allele_freq"] = df.allele_freq.astype("float64")
+    df["sample_size"] = df.sample_size.astype("int64")
+    df["resolution"] = 1 + df.allele.str.count(":")
+    # Stored as text so that all partitions have the same schema
+    for column in ["allele", "population", "carriers%", "region"] + tags:
+        df[column] = df[column].astype(str)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=["loci", "country"],
+        partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+    with open(metadata_file, "w") as f:
+        json.dump({"standard": standard, "tags": tags}, f)
+
+
+def build_snapshot(
+    path,
+    loci=("A", "B", "C"),
+    countries=None,
+    standard="s",
+    resolution=2,
+    resolution_pattern="bigger_equal_than",
+    tags=None,
+    workers=4,
+    cache=None,
+    checkpoint=None,
+):
+    """Download allele frequency data for many countries and loci into a snapshot.
+
+    Every country and locus is downloaded with `HLAfreq.getAFbatch()` and the
+    results written with `write_snapshot()`.
+
+    Populations can be tagged with values of search filters that aren't in
+    the downloaded results, so they can be queried locally. For each locus,
+    each value of each tag is searched and matching populations are given
+    that value. For example
+    `tags={"ethnic": ["Black", "Caucasian"]}` adds an `ethnic` column to the
+    snapshot so that `query_snapshot(path, ethnic="Black")` works. Populations
+    matching several values have them all, in the order given, joined by "|",
+    e.g. "Black|Caucasian", and are found by querying any of them. Populations
+    matching no value have an empty tag.
+
+    Args:
+        path (str): Directory of the snapshot.
+        loci (list, optional): Loci to download. Defaults to ("A", "B", "C").
+        countries (pd.DataFrame or list, optional): Countries to download, either a
+            list of country names or a table with `Country` and `Region` columns.
+            Defaults to all countries from `HLAfreq_data.load_countries()`.
+        standard (str, optional): Study quality standard, see `HLAfreq.makeURL()`.
+            Defaults to "s".
+        resolution (int, optional): Resolution filter, see `HLAfreq.makeURL()`.
+            Defaults to 2.
+        resolution_pattern (str, optional): Resolution comparitor, see
+            `HLAfreq.makeURL()`. Defaults to "bigger_equal_than".
+        tags (dict, optional): makeURL() argument name, one of `TAGGABLE`, to a list
+            of values to tag populations with. Defaults to None.
+        workers (int, optional): Number of pages to download at once. Defaults to 4.
+        cache (HLAfreq_cache.ResponseCache, optional): On disk cache of downloaded
+            pages, see `HLAfreq.getAFdata()`.
+        checkpoint (str, optional): Directory to save pages to as they are
+            downloaded, see `HLAfreq.getAFdata()`.
+
+    Returns:
+        pd.DataFrame: Status of each search, see `HLAfreq.getAFbatch()`. Countries
+            without data for a locus have status "failed".
+    """
+    tags = tags or {}
+    for tag in tags:
+        if tag not in TAGGABLE:
+            raise AssertionError("tags must be in %s, not %s" % (TAGGABLE, tag))
+    regions = _countries_regions(countries)
+    search = {
+        "standard": standard,
+        "resolution": resolution,
+        "resolution_pattern": resolution_pattern,
+    }
+    queries = {
+        ("data", locus, country): dict(search, country=country, locus=locus)
+        for locus in loci
+        for country in regions
+    }
+    for tag, values in tags.items():
+        for value in values:
+            for locus in loci:
+                queries[(tag, locus, value)] = dict(search, locus=locus, **{tag: value})
+    aftabs, status = HLAfreq.getAFbatch(
+        queries, workers=workers, cache=cache, checkpoint=checkpoint
+    )
+    # population of each locus to values of each tag
+    tag_values = {tag: {} for tag in tags}
+    for (kind, locus, value), aftab in aftabs.items():
+        if kind in tags:
+            for population in aftab.population.unique():
+                tag_values[kind].setdefault((locus, population), set()).add(value)
+    data = []
+    for (kind, locus, country), aftab in aftabs.items():
+        if not kind == "data":
+            continue
+        aftab = aftab.assign(country=country, region=regions[country])
+        for tag in tags:
+            matched = {
+                key: _SEPARATOR.join(v for v in tags[tag] if v in values)
+                for key, values in tag_values[tag].items()
+            }
+            aftab[tag] = [
+                matched.get((locus, population), "") for population in aftab.population
+            ]
+        data.append(aftab)
+    if data:
+        write_snapshot(pd.concat(data), path, standard=standard, tags=list(tags))
+    return status
+
+
+def query_snapshot(
+    path,
+    country="",
+    standard="s",
+    locus="",
+    resolution_pattern="bigger_equal_than",
+    resolution=2,
+    region="",
+    ethnic="",
+    study_type="",
+    dataset_source="",
+    sample_year="",
+    sample_year_pattern="",
+    sample_size="",
+    sample_size_pattern="",
+):
+    """Get allele frequency data from a snapshot.
+
+    Arguments are those of `HLAfreq.makeURL()`, but applied to the local
+    snapshot rather than downloading a search. Only matching partitions
+    and row groups are read.
+
+    Args:
+        path (str): Directory of the snapshot.
+        country (str, optional): Country name. Defaults to "".
+        standard (str, optional): Study quality standard, must match the standard
+            the snapshot was built with. Defaults to "s".
+        locus (str, optional): Locus. Defaults to "".
+        resolution_pattern (str, optional): Resolution comparitor {'equal',
+            'different', 'less_than', 'bigger_than', 'less_equal_than',
+            'bigger_equal_than'}. Defaults to "bigger_equal_than".
+        resolution (int, optional): Number of fields of resolution of allele.
+            Defaults to 2.
+        region (str, optional): Geographic region. Defaults to "".
+        ethnic (str, optional): Ethnicity, requires `ethnic` tags. Defaults to "".
+        study_type (str, optional): Type of study, requires `study_type` tags.
+            Defaults to "".
+        dataset_source (str, optional): Source of data, requires `dataset_source`
+            tags. Defaults to "".
+        sample_year (int, optional): Not available in snapshots, raises an
+            AssertionError if set. Defaults to "".
+        sample_year_pattern (str, optional): Not available in snapshots, raises an
+            AssertionError if set. Defaults to "".
+        sample_size (int, optional): Sample size to compare to. Defaults to "".
+        sample_size_pattern (str, optional): Pattern to compare sample size to.
+            Defaults to "".
+
+    Returns:
+        pd.DataFrame: Formatted allele frequency data as from `HLAfreq.getAFdata()`
+            with additional `country` and `region` columns and any tags.
+    """
+    with open(os.path.join(path, _METADATA)) as f:
+        metadata = json.load(f)
+    if not standard == metadata["standard"]:
+        raise AssertionError(
+            "Snapshot %s was built with standard %s, not %s"
+            % (path, metadata["standard"], standard)
+        )
+    if sample_year or sample_year_pattern:
+        raise AssertionError(
+            "sample_year is not stored in snapshots, use HLAfreq.makeURL()"
+        )
+    filters = []
+    tag_filters = {}
+    if locus:
+        filters.append(ds.field("loci") == locus)
+    if country:
+        filters.append(ds.field("country") == country)
+    if region:
+        filters.append(ds.field("region") == region)
+    if resolution:
+        filters.append(_compare("resolution", resolution_pattern, int(resolution)))
+    if sample_size:
+        filters.append(_compare("sample_size", sample_size_pattern, int(sample_size)))
+    for tag, value in zip(TAGGABLE, [ethnic, study_type, dataset_source]):
+        if not value:
+            continue
+        if tag not in metadata["tags"]:
+            raise AssertionError(
+                "Snapshot %s has no %s tags, rebuild with build_snapshot(tags=...)"
+                % (path, tag)
+            )
+        # Matches any of a population's values, checked exactly below
+        filters.append(pc.match_substring(ds.field(tag), value))
+        tag_filters[tag] = value
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    columns = _COLUMNS + ["country", "region"] + metadata["tags"]
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    # Partition columns are read as categoricals
+    for column in ["loci", "country"]:
+        df[column] = df[column].astype(str).astype(object)
+    for tag, value in tag_filters.items():
+        df = df[[value in values.split(_SEPARATOR) for values in df[tag]]]
+    return df.reset_index(drop=True)
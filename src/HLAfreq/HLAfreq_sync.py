@@ -0,0 +1,225 @@
+"""
+Update a previous download, keeping the rows that haven't changed.
+
+New studies are added to allelefrequencies.net over time, but most of a
+search's results stay the same. `syncAFdata()` compares a search with a
+table previously downloaded by `HLAfreq.getAFdata()`, downloading as few
+pages as it can, and reports which populations were added, removed or
+changed.
+
+Rows of a search are in a fixed order and are compared with the stored
+table by row fingerprints. The first and last pages and the number of rows
+are checked first, if they are unchanged the stored table is kept after two
+requests. Otherwise the first and last changed pages are found by bisection,
+pages before the first change match the stored rows and pages after the
+last change match them shifted by the change in number of rows, and only
+the pages in between are downloaded.
+
+Bisection assumes rows were only added, or only removed, e.g. new studies
+added to the database. If rows may have been both added and removed, or
+changed without changing the first or last page, the changes can be missed.
+`full=True` downloads every page and compares each, which finds any change
+but costs as many requests as `HLAfreq.getAFdata()`.
+
+```
+from HLAfreq import HLAfreq_sync
+aftab = pd.read_csv("Uganda_A_raw.csv")
+aftab, changes = HLAfreq_sync.syncAFdata(base_url, aftab)
+```
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import HLAfreq
+from HLAfreq.HLAfreq import _getPageText, _getPageAF
+
+# Columns that identify a row, others are derived or not always stored
+_FINGERPRINT_COLUMNS = ["allele", "population", "allele_freq", "sample_size"]
+
+
+def fingerprint(AFtab):
+    """Fingerprint each row of allele frequency data.
+
+    Args:
+        AFtab (pd.DataFrame): Formatted allele frequency data.
+
+    Returns:
+        np.array: Hash of each row, equal rows have equal hashes regardless of
+            whether they were read from a file or downloaded.
+    """
+    df = AFtab[_FINGERPRINT_COLUMNS].astype(str)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def population_fingerprints(AFtab, datasetID="population"):
+    """Fingerprint the rows of each population.
+
+    Args:
+        AFtab (pd.DataFrame): Formatted allele frequency data.
+        datasetID (str, optional): Unique identifier column for study.
+            Defaults to 'population'.
+
+    Returns:
+        pd.Series: A hash for each population, independent of row order.
+    """
+    hashes = pd.Series(fingerprint(AFtab), index=AFtab[datasetID].to_numpy())
+    # Sum so that row order within a population doesn't matter
+    return hashes.groupby(level=0, observed=True).sum()
+
+
+def compare_populations(old, new, datasetID="population"):
+    """Report populations added, removed, or changed between two tables.
+
+    Args:
+        old (pd.DataFrame): Formatted allele frequency data.
+        new (pd.DataFrame): Formatted allele frequency data.
+        datasetID (str, optional): Unique identifier column for study.
+            Defaults to 'population'.
+
+    Returns:
+        pd.DataFrame: `datasetID` and `status` ("added", "removed", or
+            "changed") of each population that differs.
+    """
+    old = population_fingerprints(old, datasetID)
+    new = population_fingerprints(new, datasetID)
+    status = pd.concat(
+        [
+            pd.Series("added", index=new.index.difference(old.index)),
+            pd.Series("removed", index=old.index.difference(new.index)),
+        ]
+    )
+    shared = new.index.intersection(old.index)
+    changed = shared[new[shared].to_numpy() != old[shared].to_numpy()]
+    status = pd.concat([status, pd.Series("changed", index=changed)])
+    status = status.rename_axis(datasetID).rename("status").reset_index()
+    return status.astype({datasetID: object, "status": object})
+
+
+def _bisect(lo, hi, before):
+    """Bisect pages lo..hi for the last page that is `before` a change.
+
+    `before(lo)` must be True, or `lo` the page before the first, and
+    `before(hi)` False, or `hi` the page after the last.
+    """
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if before(mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo, hi
+
+
+def syncAFdata(
+    base_url,
+    stored,
+    timeout=20,
+    ignoreG=True,
+    workers=4,
+    session=None,
+    cache=False,
+    datasetID="population",
+    full=False,
+):
+    """Update a previous download of a search, keeping unchanged rows.
+
+    Only pages that changed are downloaded, see the module description for
+    the changes this can miss. Use `full=True` to download and compare every
+    page.
+
+    Args:
+        base_url (str): URL for base search, as used to download `stored`.
+        stored (pd.DataFrame): Formatted result of `HLAfreq.getAFdata(base_url)`,
+            in its original row order. May have been saved to and read from csv.
+        timeout (int, optional): How long to wait to receive a response.
+            Defaults to 20.
+        ignoreG (bool, optional): treat allele G groups as normal. Defaults to True.
+        workers (int, optional): Number of pages to download at once.
+            Defaults to 4.
+        session (requests.Session, optional): Session to download with. Defaults
+            to the shared session, see `HLAfreq_session`.
+        cache (HLAfreq_cache.ResponseCache, optional): Cache of downloaded pages.
+            Defaults to False, as a cache would return the old pages.
+        datasetID (str, optional): Unique identifier column for study, used to
+            report changes. Defaults to 'population'.
+        full (bool, optional): Download every page rather than only the pages
+            found to have changed. Defaults to False.
+
+    Returns:
+        tuple: The updated allele frequency data, rows in the same order as
+            `HLAfreq.getAFdata()`, and a pd.DataFrame of populations that were
+            added, removed, or changed, see `compare_populations()`.
+    """
+    if workers < 1:
+        raise AssertionError("workers must be at least 1, not %s" % workers)
+    old = fingerprint(stored)
+    text = _getPageText(base_url, timeout, session, cache)
+    N = HLAfreq.Npages(text)
+    if N == 0:
+        print("Search has no results")
+        updated = stored.iloc[:0]
+        return updated, compare_populations(stored, updated, datasetID)
+    pages = {1: HLAfreq.formatAF(HLAfreq.parseAF(text), ignoreG, inplace=True)}
+
+    def page(p):
+        if p not in pages:
+            url = base_url + "page=" + str(p)
+            tab = _getPageAF(url, timeout, session, cache)
+            pages[p] = HLAfreq.formatAF(tab, ignoreG, inplace=True)
+        return pages[p]
+
+    def download(ps):
+        ps = [p for p in ps if p not in pages]
+        if ps:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for p, tab in zip(ps, executor.map(page, ps)):
+                    pages[p] = tab
+
+    # Rows per page and total rows now
+    P = len(pages[1])
+    L = (N - 1) * P + len(page(N))
+    shift = L - len(old)
+
+    def matches(p, offset):
+        rows = fingerprint(page(p))
+        start = (p - 1) * P - offset
+        if start < 0 or start + len(rows) > len(old):
+            return False
+        return np.array_equal(old[start: start + len(rows)], rows)
+
+    if full:
+        # Every page is needed to be sure it is unchanged
+        download(range(2, N + 1))
+        # Pages 1..front are unchanged
+        front = 0
+        while front < N and matches(front + 1, 0):
+            front += 1
+        # Pages back..N are unchanged, shifted by the change in rows
+        back = N + 1
+        while back - 1 > front and matches(back - 1, shift):
+            back -= 1
+    else:
+        # Start from what the first and last pages show
+        lo, hi = 0, N + 1
+        for p in (1, N):
+            if lo < p < hi:
+                if matches(p, 0):
+                    lo = p
+                else:
+                    hi = p
+        front, _ = _bisect(lo, hi, lambda p: matches(p, 0))
+        lo = N if front < N and not matches(N, shift) else front
+        _, back = _bisect(lo, N + 1, lambda p: not matches(p, shift))
+        download(range(front + 1, back))
+    print("%s of %s pages changed" % (back - front - 1, N))
+    tabs = [stored.iloc[: min(front * P, L)]]
+    tabs += [pages[p] for p in range(front + 1, back)]
+    start = (back - 1) * P
+    if start < L:
+        tabs.append(stored.iloc[start - shift:])
+    updated = pd.concat(tabs)
+    # Index each row by its position on its page, as getAFdata() does
+    updated.index = np.arange(len(updated)) % P if P else updated.index
+    changes = compare_populations(stored, updated, datasetID)
+    return updated, changes
@@ -0,0 +1,224 @@
+"""
+Validate allele frequency data before combining studies.
+
+`HLAfreq.combineAF()` and `HLAfreq_pymc` require data of a single locus,
+with each allele once per study, complete studies, and alleles of one
+resolution. `validate()` computes all of these in a single pass over the
+data and returns a `ValidationReport`, rather than running
+`HLAfreq.single_loci()`, `HLAfreq.alleles_unique_in_study()`,
+`HLAfreq.incomplete_studies()` and `HLAfreq.check_resolution()` one after
+another.
+
+With `cache=True` the report is kept for as long as the frame exists and
+reused while the frame's study, allele, locus and frequency values hash the
+same, so any change, including editing the frame in place, validates again.
+Hashing reads every row but is cheaper than validating. The cache is held
+outside the frame, so it doesn't affect `attrs`, copies or saved files.
+Caching is off by default, and `HLAfreq.combineAF()` always validates afresh.
+
+```
+from HLAfreq import HLAfreq_validate
+report = HLAfreq_validate.validate(aftab)
+report.incomplete
+report.check()
+```
+"""
+
+from dataclasses import dataclass
+import weakref
+import numpy as np
+import pandas as pd
+from HLAfreq import HLAfreq_allele
+
+# id of each frame validated with cache=True to (frame, key, report), an entry
+# is removed when its frame is garbage collected
+_reports = {}
+
+
+@dataclass(frozen=True)
+class ValidationReport:
+    """Results of validating allele frequency data.
+
+    Attributes:
+        datasetID (str): Unique identifier column for study.
+        llimit (float): Lower allele_freq sum limit that counts as complete.
+        ulimit (float): Upper allele_freq sum limit that counts as complete.
+        loci (list): Distinct loci in the data.
+        duplicated (pd.Series): Number of times each allele appears in a study,
+            for alleles appearing more than once, indexed by `datasetID` and
+            `allele`.
+        totals (pd.Series): Total allele frequency of each study, indexed by
+            `datasetID` and `loci`.
+        resolutions (pd.Series): Number of alleles of each resolution.
+    """
+
+    datasetID: str
+    llimit: float
+    ulimit: float
+    loci: list
+    duplicated: pd.Series
+    totals: pd.Series
+    resolutions: pd.Series
+
+    @property
+    def single_locus(self):
+        """True if the data is of a single locus"""
+        return len(self.loci) == 1
+
+    @property
+    def unique(self):
+        """True if no allele appears more than once in a study"""
+        return self.duplicated.empty
+
+    @property
+    def incomplete(self):
+        """Total allele frequency of studies that don't sum to 1, as
+        `HLAfreq.incomplete_studies()`"""
+        low = self.totals[self.totals < self.llimit]
+        high = self.totals[self.totals > self.ulimit]
+        return pd.concat([low, high])
+
+    @property
+    def complete(self):
+        """True if all studies sum to 1, within limits"""
+        return self.incomplete.empty
+
+    @property
+    def single_resolution(self):
+        """True if all alleles have the same resolution"""
+        return len(self.resolutions) == 1
+
+    def check(self, unique=True, complete=True, resolution=True, single_locus=True):
+        """Raise an error if the data can't be combined.
+
+        Details of failed checks are printed as by the individual check
+        functions.
+
+        Args:
+            unique (bool, optional): Check that each allele appears no more than
+                once per study. Defaults to True.
+            complete (bool, optional): Check study completeness. Defaults to True.
+            resolution (bool, optional): Check that all alleles have the same
+                resolution. Defaults to True.
+            single_locus (bool, optional): Check that the data is of a single
+                locus. Defaults to True.
+        """
+        if single_locus and not self.single_locus:
+            raise AssertionError("'AFtab' must conatain only 1 loci")
+        if unique and not self.unique:
+            print(f"Non unique alleles in study, is datasetID correct? {self.datasetID}")
+            print(self.duplicated)
+            raise AssertionError("The same allele appears multiple times in a dataset")
+        if complete and not self.complete:
+            print(self.incomplete)
+            raise AssertionError(
+                "AFtab contains studies with AF that doesn't sum to 1. Check"
+                "incomplete_studies(AFtab)"
+            )
+        if resolution and not self.single_resolution:
+            print(self.resolutions)
+            print("Multiple resolutions in AFtab. Fix with decrease_resolution()")
+            raise AssertionError(
+                "AFtab conains alleles at multiple resolutions, check check_resolution(AFtab)"
+            )
+
+
+def _factorize(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values)
+
+
+def _pairs(a, b, values=None):
+    """Distinct pairs of codes `a` and `b`, their counts and sum of `values`.
+
+    Rows with a missing code are ignored, as by `groupby()`.
+    """
+    keep = (a >= 0) & (b >= 0)
+    nb = b.max() + 1 if len(b) else 1
+    key = a[keep].astype(np.int64) * nb + b[keep]
+    pair, keys = pd.factorize(key)
+    counts = np.bincount(pair, minlength=len(keys))
+    sums = None
+    if values is not None:
+        sums = np.bincount(pair, weights=values[keep], minlength=len(keys))
+    return keys // nb, keys % nb, counts, sums
+
+
+def _cache_key(AFtab, datasetID):
+    """Hash of the values validation depends on, in any row order.
+
+    Every row is hashed, so any change to study, allele or locus names or
+    allele frequencies gives a different key, including changes in place.
+    """
+    columns = [datasetID, "allele", "loci", "allele_freq"]
+    hashes = pd.util.hash_pandas_object(AFtab[columns], index=False).to_numpy()
+    return (len(AFtab), int(hashes.sum()))
+
+
+def validate(AFtab, datasetID="population", llimit=0.95, ulimit=1.1, cache=False):
+    """Check allele frequency data can be combined, in a single pass.
+
+    Args:
+        AFtab (pd.DataFrame): Formatted allele frequency data.
+        datasetID (str, optional): Unique identifier column for study.
+            Defaults to 'population'.
+        llimit (float, optional): Lower allele_freq sum limit that counts as complete.
+            Defaults to 0.95.
+        ulimit (float, optional): Upper allele_freq sum limit that counts as complete.
+            Defaults to 1.1.
+        cache (bool, optional): Reuse the report of an earlier `validate(AFtab,
+            cache=True)` if the data is unchanged, and keep this report for
+            later calls. Defaults to False.
+
+    Returns:
+        ValidationReport: Results of all checks.
+    """
+    if cache:
+        key = (datasetID, llimit, ulimit, _cache_key(AFtab, datasetID))
+        cached = _reports.get(id(AFtab))
+        if cached is not None and cached[0]() is AFtab and cached[1] == key:
+            return cached[2]
+    datasets, dataset_names = _factorize(AFtab[datasetID])
+    alleles, allele_names = _factorize(AFtab.allele)
+    loci, loci_names = _factorize(AFtab.loci)
+    loci_list = list(loci_names) + ([np.nan] if (loci == -1).any() else [])
+    # Count alleles in each study
+    d, a, counts, _ = _pairs(datasets, alleles)
+    dup = counts > 1
+    duplicated = pd.Series(
+        counts[dup],
+        index=pd.MultiIndex.from_arrays(
+            [dataset_names.take(d[dup]), allele_names.take(a[dup])],
+            names=[datasetID, "allele"],
+        ),
+        name="size",
+    )
+    # Sum allele frequencies of each study, missing frequencies count as 0
+    freqs = np.nan_to_num(AFtab.allele_freq.to_numpy(dtype=np.float64))
+    d, loc, _, sums = _pairs(datasets, loci, freqs)
+    totals = pd.Series(
+        sums,
+        index=pd.MultiIndex.from_arrays(
+            [dataset_names.take(d), loci_names.take(loc)], names=[datasetID, "loci"]
+        ),
+        name="allele_freq",
+    ).sort_index()
+    # Resolution of each distinct allele, counted over rows
+    resolution = HLAfreq_allele.resolution(pd.Series(allele_names, name="allele"))
+    resolutions = (
+        pd.Series(np.bincount(alleles[alleles >= 0], minlength=len(allele_names)))
+        .groupby(resolution.to_numpy())
+        .sum()
+        .rename_axis("allele")
+        .rename("count")
+    )
+    resolutions = resolutions[resolutions > 0].sort_values(ascending=False, kind="stable")
+    report = ValidationReport(
+        datasetID, llimit, ulimit, loci_list, duplicated, totals, resolutions
+    )
+    if cache:
+        if id(AFtab) not in _reports:
+            weakref.finalize(AFtab, _reports.pop, id(AFtab), None)
+        _reports[id(AFtab)] = (weakref.ref(AFtab), key, report)
+    return report
@@ -0,0 +1,158 @@
+"""
+Local stand-in for allelefrequencies.net.
+
+Serves recorded results pages from `tests/data/` over HTTP so that the
+download functions can be tested and benchmarked offline. Any number of
+pages can be served, recorded pages are reused in turn with their page
+number updated and population names made unique. Responses can be delayed
+by `latency` seconds and a fraction `error_rate`, or those chosen by `fail`,
+answered with 503 Service Unavailable.
+
+```
+with FakeAFServer(npages=20, latency=0.05) as server:
+    aftab = HLAfreq.getAFdata(server.makeURL(country="Uganda", locus="A"))
+```
+"""
+
+import glob
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import HLAfreq
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+_NAVIGATION = re.compile(r"(Page\s*<b>)\d+(</b>\s*of\s*)\d+")
+_POPULATION = re.compile(r"(pop6001c\.asp\?pop_id=\d+\"?>)([^<]*)(</a>)")
+
+
+class FakeAFServer:
+    """Serve recorded allelefrequencies.net results pages on localhost.
+
+    Use as a context manager, the server runs in a background thread.
+
+    Args:
+        pages (list, optional): Paths of recorded results pages. Defaults to the
+            pages of search `afnet_A` in `tests/data/`.
+        npages (int, optional): Number of pages of results to serve. Defaults to
+            the number of recorded pages.
+        latency (float, optional): Seconds to wait before each response.
+            Defaults to 0.
+        error_rate (float, optional): Fraction of requests answered with status
+            503. Defaults to 0.
+        seed (int, optional): Seed for which requests fail. Defaults to 0.
+        fail (function, optional): Called with the query parameters of each
+            request, as a dict of name to value, requests it returns True for
+            are answered with status 503. Can be changed while serving.
+            Defaults to None.
+    """
+
+    def __init__(
+        self, pages=None, npages=None, latency=0, error_rate=0, seed=0, fail=None
+    ):
+        if pages is None:
+            pages = sorted(glob.glob(os.path.join(DATA, "afnet_A_page*.html")))
+        self.recorded = []
+        for page in pages:
+            with open(page, encoding="utf-8") as f:
+                self.recorded.append(f.read())
+        self.npages = len(self.recorded) if npages is None else npages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fail = fail
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def page(self, page):
+        """Text of results page number `page`"""
+        n = len(self.recorded)
+        text = _NAVIGATION.sub(
+            r"\g<1>%s\g<2>%s" % (page, self.npages), self.recorded[(page - 1) % n]
+        )
+        copy = (page - 1) // n
+        if copy:
+            text = _POPULATION.sub(r"\g<1>\g<2> %s\g<3>" % copy, text)
+        return text
+
+    def _respond(self, handler):
+        query = {
+            name: values[0]
+            for name, values in parse_qs(urlparse(handler.path).query).items()
+        }
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.error_rate
+            if self.fail is not None:
+                fail = fail or bool(self.fail(query))
+            self.errors += fail
+        if self.latency:
+            time.sleep(self.latency)
+        page = int(query.get("page", "1"))
+        if fail:
+            handler.send_response(503)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        if not 1 <= page <= self.npages:
+            # The real site returns an empty results table
+            page = self.npages
+        body = self.page(page).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/html; charset=utf-8")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    @property
+    def root(self):
+        """URL of the server root"""
+        host, port = self._server.server_address[:2]
+        return "http://%s:%s/" % (host, port)
+
+    def makeURL(self, **kwargs):
+        """`HLAfreq.makeURL()` for a search of this server"""
+        return HLAfreq.makeURL(**kwargs).replace(
+            "http://www.allelefrequencies.net/", self.root
+        )
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._respond(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # Clients may disconnect mid-response, e.g. cancelled downloads
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
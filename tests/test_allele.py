@@ -0,0 +1,40 @@
+"""Parsing allele names once per distinct name"""
+import numpy as np
+import pandas as pd
+from HLAfreq import HLAfreq_allele
+
+alleles = pd.Series(
+    ["A*02:01:01:02L", "B*10:01", None, "A*02:9", "C*01:01:01G", "A*02:10", "A*02:9"],
+    name="allele",
+)
+
+
+def test_allele_fields():
+    fields = HLAfreq_allele.allele_fields(alleles)
+    assert fields.iloc[0].tolist() == ["A", 2, 1, 1, 2, "L", 4]
+    assert fields.iloc[4].tolist() == ["C", 1, 1, 1, -1, "G", 3]
+    assert fields.iloc[2].tolist() == ["", -1, -1, -1, -1, "", -1]
+
+
+def test_matches_string_methods():
+    present = alleles.dropna()
+    for categorical in [False, True]:
+        values = present.astype("category") if categorical else present
+        pd.testing.assert_series_equal(
+            HLAfreq_allele.resolution(values), 1 + present.str.count(":")
+        )
+        pd.testing.assert_series_equal(
+            HLAfreq_allele.loci(values), present.str.split("*").str[0]
+        )
+        pd.testing.assert_series_equal(
+            HLAfreq_allele.truncate(values, 2),
+            present.str.split(":").str[:2].str.join(":"),
+        )
+    assert np.isnan(HLAfreq_allele.resolution(alleles)[2])
+
+
+def test_allele_rank():
+    ordered = alleles.sort_values(key=HLAfreq_allele.allele_rank).tolist()
+    assert ordered == [
+        "A*02:01:01:02L", "A*02:9", "A*02:9", "A*02:10", "B*10:01", "C*01:01:01G", None
+    ]
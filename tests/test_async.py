@@ -0,0 +1,46 @@
+"""Async downloads against a local stand-in for allelefrequencies.net"""
+import asyncio
+import pytest
+import pandas as pd
+import HLAfreq
+from fakeserver import FakeAFServer
+
+aiohttp = pytest.importorskip("aiohttp")
+from HLAfreq import HLAfreq_async  # noqa: E402
+
+
+def test_getAFdata_matches_sync():
+    with FakeAFServer(npages=5) as server:
+        base_url = server.makeURL(country="Uganda", locus="A")
+        expected = HLAfreq.getAFdata(base_url, cache=False)
+        aftab = asyncio.run(HLAfreq_async.getAFdata(base_url, cache=False))
+        N = asyncio.run(HLAfreq_async.Npages(base_url, cache=False))
+    pd.testing.assert_frame_equal(aftab, expected)
+    assert N == 5
+
+
+def test_many_searches_with_errors():
+    async def main(urls):
+        semaphore = asyncio.Semaphore(4)
+        async with aiohttp.ClientSession() as session:
+            return await asyncio.gather(*[
+                HLAfreq_async.getAFdata(
+                    url, session=session, semaphore=semaphore, cache=False,
+                    retries=10, backoff_factor=0,
+                )
+                for url in urls
+            ])
+
+    with FakeAFServer(npages=3, error_rate=0.4) as server:
+        urls = [server.makeURL(country=c, locus="A") for c in ["Uganda", "Kenya", "Peru"]]
+        aftabs = asyncio.run(main(urls))
+        assert server.errors > 0
+        server.error_rate = 0
+        expected = HLAfreq.getAFdata(urls[0], cache=False)
+    for aftab in aftabs:
+        pd.testing.assert_frame_equal(aftab, expected)
+
+
+def test_compact_requires_format():
+    with pytest.raises(AssertionError):
+        asyncio.run(HLAfreq_async.getAFdata("", compact=True, format=False))
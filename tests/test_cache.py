@@ -0,0 +1,65 @@
+"""On disk cache of downloaded pages against a local stand-in for allelefrequencies.net"""
+import os
+import time
+import pandas as pd
+import pytest
+import HLAfreq
+from HLAfreq import HLAfreq_cache
+from fakeserver import FakeAFServer
+
+
+def age(cache, url, seconds):
+    """Make the cached page of `url` downloaded and used `seconds` ago"""
+    past = time.time() - seconds
+    os.utime(cache._file(url), (past, past))
+
+
+def test_ttl_expiry(tmp_path):
+    cache = HLAfreq_cache.ResponseCache(str(tmp_path), ttl=60)
+    with FakeAFServer(npages=2) as server:
+        base_url = server.makeURL(locus="A")
+        first = HLAfreq.getAFdata(base_url, cache=cache)
+        requests = server.requests
+        # Within ttl nothing is downloaded
+        HLAfreq.getAFdata(base_url, cache=cache)
+        assert server.requests == requests
+        # Expired pages are downloaded again
+        age(cache, base_url, 120)
+        assert cache.get(base_url) is None
+        second = HLAfreq.getAFdata(base_url, cache=cache)
+        assert server.requests == requests + 1
+    assert cache.get(base_url) is not None
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_lru_eviction(tmp_path):
+    cache = HLAfreq_cache.ResponseCache(str(tmp_path))
+    text = "<html>" + "x" * 1000 + "</html>"
+    for url in ["a", "b", "c"]:
+        cache.set(url, text)
+    age(cache, "a", 300)
+    age(cache, "b", 200)
+    age(cache, "c", 100)
+    # Using a page makes it most recently used
+    assert cache.get("a") == text
+    cache.max_size = 3 * os.path.getsize(cache._file("a"))
+    cache.set("d", text)
+    assert cache.get("b") is None
+    for url in ["a", "c", "d"]:
+        assert cache.get(url) == text
+
+
+def test_offline(tmp_path):
+    with FakeAFServer(npages=2) as server:
+        base_url = server.makeURL(locus="A")
+        online = HLAfreq.getAFdata(
+            base_url, cache=HLAfreq_cache.ResponseCache(str(tmp_path))
+        )
+        requests = server.requests
+        offline = HLAfreq_cache.ResponseCache(str(tmp_path), ttl=60, offline=True)
+        # Expired pages are still used offline
+        age(offline, base_url, 120)
+        pd.testing.assert_frame_equal(HLAfreq.getAFdata(base_url, cache=offline), online)
+        with pytest.raises(Exception, match="offline cache"):
+            HLAfreq.getAFdata(server.makeURL(locus="B"), cache=offline)
+        assert server.requests == requests
@@ -0,0 +1,110 @@
+"""Tests combining all loci at once match combining each locus"""
+
+import subprocess
+import sys
+import pandas as pd
+import pytest
+import HLAfreq
+from HLAfreq import HLAfreq_matrix
+
+aftab = pd.DataFrame(
+    {
+        "allele": ["A*02:03", "A*02:05", "A*02:07", "A*02:03", "A*02:05",
+                   "B*07:02", "B*08:01", "B*07:02"],
+        "loci": ["A", "A", "A", "A", "A", "B", "B", "B"],
+        "population": ["test1", "test1", "test1", "test2", "test2",
+                       "test1", "test1", "test2"],
+        "allele_freq": [0.1, 0.3, 0.6, 0.5, 0.5, 0.4, 0.6, 1.0],
+        "sample_size": [10, 10, 10, 5, 5, 12, 12, 8],
+    }
+)
+
+
+def each_locus(AFtab, alpha={}):
+    return pd.concat(
+        [
+            HLAfreq.combineAF(AFtab[AFtab.loci == locus], alpha=alpha.get(locus, []))
+            for locus in ["A", "B"]
+        ],
+        ignore_index=True,
+    )
+
+
+def test_combine_loci():
+    pd.testing.assert_frame_equal(HLAfreq.combineAF_loci(aftab), each_locus(aftab))
+
+
+def test_combine_loci_prior():
+    alpha = {"B": [2, 3]}
+    caf = HLAfreq.combineAF_loci(aftab, alpha=alpha)
+    pd.testing.assert_frame_equal(caf, each_locus(aftab, alpha))
+    assert caf.groupby("loci").allele_freq.sum().tolist() == pytest.approx([1, 1])
+    with pytest.raises(AssertionError):
+        HLAfreq.combineAF_loci(aftab, alpha={"B": [1]})
+
+
+def test_combine_loci_matrix():
+    afm = HLAfreq_matrix.AFMatrix.from_long(aftab)
+    pd.testing.assert_frame_equal(HLAfreq.combineAF_loci(afm), each_locus(aftab))
+
+
+countries = pd.DataFrame(
+    {"Country": ["Uganda", "Kenya", "Peru"], "largeRegion": ["Africa", "Africa", "America"]}
+)
+grouped = pd.concat(
+    [
+        aftab.assign(country="Uganda"),
+        aftab.assign(country="Peru", population=aftab.population + "_peru"),
+        aftab[aftab.loci == "A"].assign(
+            country="Kenya", population=aftab.population + "_kenya"
+        ),
+    ],
+    ignore_index=True,
+)
+
+
+def test_combine_grouped():
+    caf = HLAfreq.combineAF_grouped(grouped, countries=countries)
+    assert caf.country.unique().tolist() == ["Kenya", "Peru", "Uganda"]
+    for country, tab in grouped.groupby("country"):
+        expected = HLAfreq.combineAF_loci(tab.drop(columns="country"))
+        result = caf[caf.country == country].drop(columns="country")
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected)
+
+
+def test_combine_grouped_region():
+    caf = HLAfreq.combineAF_grouped(grouped, by="largeRegion", countries=countries)
+    africa = grouped[grouped.country != "Peru"].drop(columns="country")
+    expected = HLAfreq.combineAF_loci(africa)
+    result = caf[caf.largeRegion == "Africa"].drop(columns="largeRegion")
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected)
+
+
+def test_combine_grouped_workers():
+    pd.testing.assert_frame_equal(
+        HLAfreq.combineAF_grouped(grouped, countries=countries, workers=2),
+        HLAfreq.combineAF_grouped(grouped, countries=countries),
+    )
+
+
+def test_combine_grouped_duplicated_allele():
+    duplicated = pd.concat([grouped, grouped.iloc[[0]]], ignore_index=True)
+    with pytest.raises(AssertionError, match="duplicated population"):
+        uganda = duplicated[duplicated.country == "Uganda"]
+        HLAfreq.combineAF(uganda[uganda.loci == "A"], unique=False)
+    with pytest.raises(AssertionError, match="duplicated population"):
+        HLAfreq.combineAF_grouped(duplicated, countries=countries, unique=False)
+
+
+def test_locus_prior():
+    loci = ["A", "A", "B", "B", "B"]
+    assert HLAfreq.locus_prior(loci) == [1, 1, 1, 1, 1]
+    assert HLAfreq.locus_prior(loci, {"B": [2, 3, 4]}) == [1, 1, 2, 3, 4]
+    assert HLAfreq.locus_prior(loci, [5, 4, 3, 2, 1]) == [5, 4, 3, 2, 1]
+
+
+def test_country_data_not_imported():
+    # Country data needs pkg_resources, so is only loaded by combineAF_grouped
+    code = "import sys, HLAfreq; print('HLAfreq.HLAfreq_data' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert out.stdout.strip() == "False"
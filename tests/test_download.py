@@ -0,0 +1,186 @@
+"""Download functions against a local stand-in for allelefrequencies.net"""
+import os
+import time
+import pandas as pd
+import pytest
+import HLAfreq
+from HLAfreq import HLAfreq_cache, HLAfreq_session
+from fakeserver import FakeAFServer
+
+
+def expected(server):
+    pages = [HLAfreq.parseAF(server.page(p)) for p in range(1, server.npages + 1)]
+    return HLAfreq.formatAF(pd.concat(pages))
+
+
+def test_Npages_and_parseAF():
+    with FakeAFServer(npages=3) as server:
+        text = HLAfreq_session.get(server.makeURL(locus="A")).text
+        assert HLAfreq.Npages(text) == 3
+        assert len(HLAfreq.parseAF(text)) > 0
+
+
+def test_serial_and_concurrent():
+    with FakeAFServer(npages=5) as server:
+        base_url = server.makeURL(country="Uganda", locus="A")
+        serial = HLAfreq.getAFdata(base_url, cache=False)
+        concurrent = HLAfreq.getAFdata(base_url, workers=4, cache=False)
+        # Base page then every page
+        assert server.requests == 2 * (1 + server.npages)
+    pd.testing.assert_frame_equal(serial, expected(server))
+    pd.testing.assert_frame_equal(concurrent, serial)
+
+
+def test_cached(tmp_path):
+    cache = HLAfreq_cache.ResponseCache(str(tmp_path))
+    with FakeAFServer(npages=4) as server:
+        base_url = server.makeURL(locus="A")
+        first = HLAfreq.getAFdata(base_url, cache=cache)
+        requests = server.requests
+        second = HLAfreq.getAFdata(base_url, cache=cache)
+        assert server.requests == requests
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_errors_retried():
+    session = HLAfreq_session.AFSession(retries=10, backoff_factor=0)
+    with FakeAFServer(npages=4, error_rate=0.3) as server:
+        aftab = HLAfreq.getAFdata(
+            server.makeURL(locus="A"), workers=2, session=session, cache=False
+        )
+        assert server.errors > 0
+    pd.testing.assert_frame_equal(aftab, expected(server))
+
+
+def test_checkpoint_resumed(tmp_path):
+    session = HLAfreq_session.AFSession(retries=0)
+    with FakeAFServer(npages=5, fail=lambda query: query.get("page") == "4") as server:
+        base_url = server.makeURL(locus="A")
+        with pytest.raises(Exception):
+            HLAfreq.getAFdata(
+                base_url, session=session, cache=False, checkpoint=str(tmp_path)
+            )
+        server.fail = None
+        requests = server.requests
+        aftab = HLAfreq.getAFdata(
+            base_url, session=session, cache=False, checkpoint=str(tmp_path)
+        )
+        # Base page then only pages 4 and 5, the rest are saved
+        assert server.requests == requests + 3
+    pd.testing.assert_frame_equal(aftab, expected(server))
+
+
+def test_checkpoint_discarded(tmp_path, capsys):
+    session = HLAfreq_session.AFSession(retries=0)
+    with FakeAFServer(npages=3, fail=lambda query: query.get("page") == "3") as server:
+        base_url = server.makeURL(locus="A")
+        with pytest.raises(Exception):
+            HLAfreq.getAFdata(
+                base_url, session=session, cache=False, checkpoint=str(tmp_path)
+            )
+        server.fail = None
+        server.npages = 4
+        requests = server.requests
+        aftab = HLAfreq.getAFdata(base_url, cache=False, checkpoint=str(tmp_path))
+        # Results may have moved between pages, so every page is downloaded
+        assert server.requests == requests + 1 + 4
+    assert "discarding checkpoint" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(aftab, expected(server))
+
+
+def test_checkpoint_removed(tmp_path):
+    with FakeAFServer(npages=3) as server:
+        base_url = server.makeURL(locus="A")
+        HLAfreq.getAFdata(base_url, cache=False, checkpoint=str(tmp_path))
+        HLAfreq.getAFbatch([base_url], cache=False, checkpoint=str(tmp_path))
+        assert os.listdir(tmp_path) == []
+        # Results changed since the completed download
+        server.recorded[1] = server.recorded[0]
+        requests = server.requests
+        aftab = HLAfreq.getAFdata(base_url, cache=False, checkpoint=str(tmp_path))
+        assert server.requests == requests + 1 + 3
+        aftabs, status = HLAfreq.getAFbatch(
+            [base_url], cache=False, checkpoint=str(tmp_path)
+        )
+        assert server.requests == requests + 2 * (1 + 3)
+    pd.testing.assert_frame_equal(aftab, expected(server))
+    pd.testing.assert_frame_equal(aftabs[0], aftab)
+
+
+def second_page_of_B(query):
+    return query.get("hla_locus") == "B" and query.get("page") == "2"
+
+
+def test_batch_partial_failure():
+    session = HLAfreq_session.AFSession(retries=0)
+    with FakeAFServer(npages=3, fail=second_page_of_B) as server:
+        queries = {locus: server.makeURL(locus=locus) for locus in ["A", "B", "C"]}
+        aftabs, status = HLAfreq.getAFbatch(queries, workers=2, session=session, cache=False)
+    assert sorted(aftabs) == ["A", "C"]
+    for locus in ["A", "C"]:
+        pd.testing.assert_frame_equal(aftabs[locus], expected(server))
+    assert status.status.to_dict() == {"A": "complete", "B": "failed", "C": "complete"}
+    assert status.pages.tolist() == [3, 3, 3]
+    assert status.url.to_dict() == queries
+    assert status.error["B"]
+    assert not status.error["A"] and not status.error["C"]
+
+
+def test_no_results():
+    with FakeAFServer(npages=0) as server:
+        aftab = HLAfreq.getAFdata(server.makeURL(locus="A"), cache=False)
+        aftabs, status = HLAfreq.getAFbatch([server.makeURL(locus="B")], cache=False)
+    assert aftab.empty
+    assert aftab.columns.tolist() == [
+        "allele", "loci", "population", "allele_freq", "carriers%", "sample_size"
+    ]
+    assert HLAfreq.is_formatted(aftab)
+    assert status.status[0] == "complete"
+    pd.testing.assert_frame_equal(aftabs[0], aftab)
+
+
+def test_iter_closed_early():
+    with FakeAFServer(npages=10) as server:
+        pages = HLAfreq.iterAFdata(server.makeURL(locus="A"), workers=2, cache=False)
+        first = next(pages)
+        next(pages)
+        pages.close()
+        requests = server.requests
+        # Base page, the two pages used, and at most one downloading ahead
+        assert requests <= 4
+        time.sleep(0.2)
+        assert server.requests == requests
+    pd.testing.assert_frame_equal(first, HLAfreq.formatAF(HLAfreq.parseAF(server.page(1))))
+
+
+@pytest.mark.parametrize("npages", [3, 0])
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_write_round_trip(tmp_path, suffix, npages):
+    if suffix == ".parquet":
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / ("aftab" + suffix))
+    # Left from an earlier download, overwritten
+    with open(path, "w") as f:
+        f.write("old")
+    with FakeAFServer(npages=npages) as server:
+        base_url = server.makeURL(locus="A")
+        rows = HLAfreq.writeAFdata(base_url, path, workers=2, cache=False)
+        aftab = HLAfreq.getAFdata(base_url, cache=False).reset_index(drop=True)
+    assert rows == len(aftab)
+    if suffix == ".csv":
+        written = pd.read_csv(path, dtype={"carriers%": str}, keep_default_na=False)
+    else:
+        written = pd.read_parquet(path)
+    pd.testing.assert_frame_equal(written, aftab, check_dtype=bool(npages))
+    assert written.columns.tolist() == aftab.columns.tolist()
+
+
+def test_compact():
+    with FakeAFServer(npages=2) as server:
+        base_url = server.makeURL(locus="A")
+        aftab = HLAfreq.getAFdata(base_url, compact=True, cache=False)
+        with pytest.raises(AssertionError):
+            HLAfreq.getAFdata(base_url, compact=True, format=False, cache=False)
+        # Rejected before downloading
+        assert server.requests == 3
+    pd.testing.assert_frame_equal(aftab, HLAfreq.compactAF(expected(server)))
@@ -0,0 +1,84 @@
+"""Tests of the study by allele matrix"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import HLAfreq
+from HLAfreq import HLAfreq_matrix, HLAfreq_pymc
+
+aftab = pd.DataFrame(
+    {
+        "allele": ["A*02:03", "A*02:05", "A*02:07", "A*02:03", "A*02:05", "B*07:02"],
+        "loci": ["A", "A", "A", "A", "A", "B"],
+        "population": ["test1", "test1", "test1", "test2", "test2", "test2"],
+        "allele_freq": [0.1, 0.3, 0.6, 0.5, 0.5, 1.0],
+        "sample_size": [10, 10, 10, 5, 5, 8],
+    }
+)
+
+
+def test_from_long():
+    afm = HLAfreq_matrix.AFMatrix.from_long(aftab)
+    assert afm.studies.tolist() == ["test1", "test2"]
+    assert afm.alleles.tolist() == ["A*02:03", "A*02:05", "A*02:07", "B*07:02"]
+    assert afm.blocks == {"A": slice(0, 3), "B": slice(3, 4)}
+    assert np.isnan(afm.freq[1, 2])
+    np.testing.assert_array_equal(afm.sample_size, [[10, np.nan], [5, 8]])
+
+
+def test_to_long_round_trip():
+    back = HLAfreq_matrix.AFMatrix.from_long(aftab).to_long()
+    expected = aftab.sort_values(["population", "allele"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(back, expected[back.columns])
+
+
+def test_duplicated_allele():
+    with pytest.raises(AssertionError):
+        HLAfreq_matrix.AFMatrix.from_long(pd.concat([aftab, aftab.iloc[:1]]))
+
+
+def test_combine_matches_long():
+    locus = aftab[aftab.loci == "A"]
+    afm = HLAfreq_matrix.AFMatrix.from_long(locus)
+    pd.testing.assert_frame_equal(HLAfreq.combineAF(afm), HLAfreq.combineAF(locus))
+    c_array, alleles = HLAfreq_pymc._make_c_array(afm)
+    expected, expected_alleles = HLAfreq_pymc._make_c_array(locus)
+    np.testing.assert_allclose(c_array, expected)
+    assert alleles == expected_alleles
+
+
+def test_combine_block():
+    afm = HLAfreq_matrix.AFMatrix.from_long(aftab)
+    with pytest.raises(AssertionError):
+        HLAfreq.combineAF(afm)
+    caf = HLAfreq.combineAF(afm.block("B"))
+    assert caf.allele.tolist() == ["B*07:02"]
+    assert caf.sample_size.tolist() == [8]
+
+
+def test_coverage():
+    afm = HLAfreq_matrix.AFMatrix.from_long(aftab)
+    coverage = afm.coverage(["A*02:03", "B*07:02"])
+    assert coverage["test1"] == pytest.approx(HLAfreq.population_coverage(0.1))
+    assert coverage["test2"] == pytest.approx(1)
+    per_allele = HLAfreq.population_coverage(afm)
+    assert per_allele.loc["test1", "A*02:07"] == pytest.approx(1 - 0.4**2)
+
+
+def test_sparse_matches_dense():
+    zero = pd.concat([aftab, aftab.iloc[:1].assign(allele="A*02:09", allele_freq=0.0)])
+    dense = HLAfreq_matrix.AFMatrix.from_long(zero)
+    sparse = HLAfreq_matrix.SparseAFMatrix.from_long(zero)
+    # Alleles reported with frequency zero are kept
+    assert sparse.freq.nnz == dense.measured.sum()
+    pd.testing.assert_frame_equal(sparse.to_long(), dense.to_long())
+    pd.testing.assert_frame_equal(sparse.todense().to_long(), dense.to_sparse().to_long())
+    for add_unmeasured in [True, False]:
+        pd.testing.assert_frame_equal(
+            HLAfreq.combineAF(sparse.block("A"), add_unmeasured=add_unmeasured),
+            HLAfreq.combineAF(dense.block("A"), add_unmeasured=add_unmeasured),
+        )
+    pd.testing.assert_series_equal(sparse.validate().totals, dense.validate().totals)
+    pd.testing.assert_series_equal(
+        sparse.coverage(["A*02:03", "B*07:02"]), dense.coverage(["A*02:03", "B*07:02"])
+    )
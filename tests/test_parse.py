@@ -0,0 +1,68 @@
+"""Parity of the fast page parser with BeautifulSoup
+
+Saved allelefrequencies.net results pages in `tests/data/` are parsed
+from text with `HLAfreq_parse` and from a BeautifulSoup tree, the
+tables and page counts must be identical.
+"""
+import glob
+import os
+import pytest
+import HLAfreq
+import pandas as pd
+from bs4 import BeautifulSoup
+
+pages = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "data", "afnet_*.html")))
+
+
+def read(page):
+    with open(page, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_pages_found():
+    assert pages
+
+
+@pytest.mark.parametrize("page", pages)
+def test_parseAF_parity(page):
+    text = read(page)
+    bs = BeautifulSoup(text, "html.parser")
+    pd.testing.assert_frame_equal(HLAfreq.parseAF(text), HLAfreq.parseAF(bs))
+
+
+@pytest.mark.parametrize("page", pages)
+def test_Npages_parity(page):
+    text = read(page)
+    bs = BeautifulSoup(text, "html.parser")
+    assert HLAfreq.Npages(text) == HLAfreq.Npages(bs)
+
+
+def test_cell_text_parity():
+    # Comments, scripts, entities, stray `<`, and unclosed cells
+    text = """<div id="divGenDetail"><table class="tblNormal">
+        <tr><th>Line</th></tr>
+        <tr><td>1</td><td> A*01:01 <!-- x --></td><td>&nbsp;</td><td>a &amp; b < c</td>
+        <td><script>s()</script>5.0</td><td>0.1(*)</td><td><img src="x.gif"></td>
+        <td><b>1</b>,000</td><td></td><td></td><td></td><td>note</tr>
+        </table></div>"""
+    bs = BeautifulSoup(text, "html.parser")
+    pd.testing.assert_frame_equal(HLAfreq.parseAF(text), HLAfreq.parseAF(bs))
+
+
+def test_empty_table_parity():
+    text = """<div id="divGenDetail"><table class="tblNormal">
+        <tr><th>Line</th></tr></table></div>"""
+    bs = BeautifulSoup(text, "html.parser")
+    pd.testing.assert_frame_equal(HLAfreq.parseAF(text), HLAfreq.parseAF(bs))
+
+
+def test_table_outside_div():
+    # The div ends before the table, in a later div
+    text = """<div id="divGenDetail"><div>No results</div></div>
+        <div id="other"><table class="tblNormal">
+        <tr><th>Line</th></tr></table></div>"""
+    bs = BeautifulSoup(text, "html.parser")
+    with pytest.raises(AttributeError, match="no results table"):
+        HLAfreq.parseAF(text)
+    with pytest.raises(AttributeError):
+        HLAfreq.parseAF(bs)
@@ -0,0 +1,65 @@
+"""Planning overlapping searches against a local stand-in for allelefrequencies.net"""
+import pandas as pd
+import pytest
+import HLAfreq
+from HLAfreq import HLAfreq_plan
+from fakeserver import FakeAFServer
+
+countries = pd.DataFrame(
+    {"Country": ["Uganda", "Kenya", "Peru"], "Region": ["East", "East", "South"]}
+)
+queries = {
+    "region": {"region": "East"},
+    "country": {"country": "Uganda"},
+    "country_locus": {"country": "Uganda", "locus": "A"},
+}
+loci = ["A", "B", "C"]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    makeURL = HLAfreq.makeURL
+    with FakeAFServer(npages=2) as server:
+        monkeypatch.setattr(
+            HLAfreq, "makeURL",
+            lambda **kwargs: makeURL(**kwargs).replace(
+                "http://www.allelefrequencies.net/", server.root
+            ),
+        )
+        yield server
+
+
+def test_plan():
+    shards, members = HLAfreq_plan.plan(queries, loci=loci, countries=countries)
+    assert len(shards) == 6
+    assert [len(members[name]) for name in queries] == [6, 3, 1]
+    assert set(members["country"]) < set(members["region"])
+
+
+def test_plan_without_loci():
+    shards, members = HLAfreq_plan.plan({"country_locus": queries["country_locus"]})
+    assert len(shards) == 1
+    with pytest.raises(AssertionError, match="no locus"):
+        HLAfreq_plan.plan(queries, countries=countries)
+
+
+def test_getAFplanned(server, tmp_path):
+    aftabs, status = HLAfreq_plan.getAFplanned(
+        queries, store=str(tmp_path), loci=loci, countries=countries, cache=False
+    )
+    # Each distinct shard downloaded once, base page then each page
+    assert server.requests == 6 * (1 + server.npages)
+    page = HLAfreq.getAFdata(server.makeURL(locus="A"), cache=False)
+    pd.testing.assert_frame_equal(
+        aftabs["country_locus"], page.reset_index(drop=True)
+    )
+    assert len(aftabs["region"]) == 6 * len(page)
+    assert (status.status == "complete").all()
+    requests = server.requests
+    stored, status = HLAfreq_plan.getAFplanned(
+        queries, store=str(tmp_path), loci=loci, countries=countries, cache=False
+    )
+    assert server.requests == requests
+    assert (status.downloaded == 0).all()
+    for name in queries:
+        pd.testing.assert_frame_equal(stored[name], aftabs[name])
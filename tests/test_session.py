@@ -0,0 +1,55 @@
+"""Rate limiting and retries against a local stand-in for allelefrequencies.net"""
+import time
+import pytest
+from HLAfreq import HLAfreq_session
+from fakeserver import FakeAFServer
+
+
+def test_rate_limiter():
+    limiter = HLAfreq_session.RateLimiter(rate_limit=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait("http://a.example/page")
+    # First request at once, then one every 1/20 seconds
+    assert time.monotonic() - start >= 4 / 20
+    # Other hosts are limited separately
+    start = time.monotonic()
+    limiter.wait("http://b.example/page")
+    assert time.monotonic() - start < 1 / 20
+    with pytest.raises(AssertionError):
+        HLAfreq_session.RateLimiter(rate_limit=0)
+
+
+def test_session_rate_limited():
+    session = HLAfreq_session.AFSession(rate_limit=10)
+    with FakeAFServer(npages=1) as server:
+        start = time.monotonic()
+        for _ in range(4):
+            HLAfreq_session.get(server.makeURL(locus="A"), session=session)
+        assert time.monotonic() - start >= 3 / 10
+        assert server.requests == 4
+
+
+class FailFirst:
+    """Fail the first `n` requests"""
+
+    def __init__(self, n):
+        self.n = n
+
+    def __call__(self, query):
+        self.n -= 1
+        return self.n >= 0
+
+
+def test_retry_server_errors():
+    with FakeAFServer(npages=1, fail=FailFirst(2)) as server:
+        session = HLAfreq_session.AFSession(retries=2, backoff_factor=0)
+        response = HLAfreq_session.get(server.makeURL(locus="A"), session=session)
+        assert response.status_code == 200
+        assert server.requests == 3
+        assert server.errors == 2
+    with FakeAFServer(npages=1, fail=FailFirst(2)) as server:
+        session = HLAfreq_session.AFSession(retries=1, backoff_factor=0)
+        with pytest.raises(Exception):
+            HLAfreq_session.get(server.makeURL(locus="A"), session=session)
+        assert server.requests == 2
@@ -7,7 +7,7 @@ import pytest
 import HLAfreq
 from HLAfreq import HLAfreq_pymc as HLAhdi
 import pandas as pd
-from scipy.stats import dirichlet
+from scipy.stats import dirichlet, beta
 
 dfa = pd.DataFrame(
     {
@@ -69,3 +69,55 @@ def test_combined_allele_freq():
 def test_hdi():
     hdi = HLAhdi.AFhdi(aftab, credible_interval=0.95)
     all(hdi.columns == ["lo", "hi", "allele", "post_mean"])
+
+
+def test_AFci():
+    ci = HLAfreq.AFci(caf, credible_interval=0.9)
+    assert ci.columns.tolist() == ["lo", "hi", "allele", "post_mean"]
+    for (a, b), lo, hi in zip(HLAfreq.betaAB(caf.alpha + caf.c), ci.lo, ci.hi):
+        assert (lo, hi) == pytest.approx(beta(a, b).ppf([0.05, 0.95]))
+    assert ci.post_mean.tolist() == pytest.approx(caf.allele_freq.tolist())
+
+
+def test_compact_dtypes_preserved():
+    compact = HLAfreq.compactAF(pd.concat([dfa, dfb, dfc]))
+    compact = HLAfreq.only_complete(compact)
+    compact = HLAfreq.decrease_resolution(compact, 2)
+    assert isinstance(compact.allele.dtype, pd.CategoricalDtype)
+    assert compact.allele_freq.dtype == "float32"
+    assert compact.sample_size.dtype == "int32"
+    compact_caf = HLAfreq.combineAF(compact)
+    assert isinstance(compact_caf.allele.dtype, pd.CategoricalDtype)
+    assert all((compact_caf.allele_freq - caf.allele_freq).abs() < 1e-6)
+
+
+def test_incomplete_studies_quiet(capsys):
+    raw = pd.concat([dfa, dfb, dfc])
+    incomplete = HLAfreq.incomplete_studies(raw, quiet=True)
+    assert capsys.readouterr().out == ""
+    assert list(incomplete.index) == [("test3", "A")]
+    complete = HLAfreq.only_complete(raw, quiet=True)
+    assert capsys.readouterr().out == ""
+    assert set(complete.population) == {"test1", "test2"}
+
+
+def test_unmeasured_alleles():
+    df = pd.concat([dfa, dfc], ignore_index=True)
+    full = HLAfreq.unmeasured_alleles(df)
+    added = full.iloc[len(df) :]
+    assert added.allele.tolist() == ["A*02:07"]
+    assert added.population.tolist() == ["test3"]
+    assert added.allele_freq.tolist() == [0]
+    assert added.sample_size.tolist() == [5]
+    assert (full.groupby("population").allele.nunique() == 3).all()
+
+
+def test_format_formatted():
+    raw = dfa.astype({"allele_freq": str, "sample_size": str})
+    formatted = HLAfreq.formatAF(raw)
+    assert not HLAfreq.is_formatted(raw)
+    assert HLAfreq.is_formatted(formatted)
+    assert HLAfreq.formatAF(formatted) is formatted
+    compact = HLAfreq.compactAF(formatted)
+    assert formatted.sample_size.dtype == "int64"
+    assert compact.sample_size.dtype == "int32"
@@ -0,0 +1,74 @@
+"""Tests writing and querying a local snapshot of allele frequency data"""
+import pytest
+import pandas as pd
+import HLAfreq
+from fakeserver import FakeAFServer
+
+pytest.importorskip("pyarrow")
+from HLAfreq import HLAfreq_snapshot  # noqa: E402
+
+aftab = pd.DataFrame(
+    {
+        "allele": ["A*01:01", "A*02:01", "A*01:01:01", "B*07:02", "A*01:01", "A*03:01"],
+        "loci": ["A", "A", "A", "B", "A", "A"],
+        "population": ["test1", "test1", "test2", "test2", "test3", "test3"],
+        "allele_freq": [0.4, 0.6, 1.0, 1.0, 0.5, 0.5],
+        "carriers%": ["", "", "", "", "", ""],
+        "sample_size": [10, 10, 50, 50, 200, 200],
+        "country": ["Uganda", "Uganda", "Kenya", "Kenya", "Peru", "Peru"],
+        "region": ["East Africa", "East Africa", "East Africa", "East Africa", "South America", "South America"],
+        "ethnic": ["Black", "Black", "", "", "Black|Caucasian", "Black|Caucasian"],
+    }
+)
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    HLAfreq_snapshot.write_snapshot(aftab, str(tmp_path), tags=["ethnic"])
+    return str(tmp_path)
+
+
+def test_query_region(snapshot):
+    df = HLAfreq_snapshot.query_snapshot(snapshot, region="East Africa", locus="A")
+    assert sorted(df.population.unique()) == ["test1", "test2"]
+    assert all(df.loci == "A")
+
+
+def test_query_resolution_and_sample_size(snapshot):
+    df = HLAfreq_snapshot.query_snapshot(snapshot, resolution=3, resolution_pattern="equal")
+    assert df.allele.tolist() == ["A*01:01:01"]
+    df = HLAfreq_snapshot.query_snapshot(
+        snapshot, sample_size=50, sample_size_pattern="bigger_equal_than"
+    )
+    assert set(df.country) == {"Kenya", "Peru"}
+
+
+def test_query_tags(snapshot):
+    df = HLAfreq_snapshot.query_snapshot(snapshot, ethnic="Black")
+    assert set(df.population) == {"test1", "test3"}
+    df = HLAfreq_snapshot.query_snapshot(snapshot, ethnic="Caucasian")
+    assert set(df.population) == {"test3"}
+    assert HLAfreq_snapshot.query_snapshot(snapshot, ethnic="Cauc").empty
+    with pytest.raises(AssertionError):
+        HLAfreq_snapshot.query_snapshot(snapshot, study_type="Anthropology")
+
+
+def test_query_sample_year(snapshot):
+    with pytest.raises(AssertionError):
+        HLAfreq_snapshot.query_snapshot(snapshot, sample_year=2000)
+
+
+def test_build_tags(tmp_path, monkeypatch):
+    with FakeAFServer(npages=2) as server:
+        monkeypatch.setattr(HLAfreq.HLAfreq, "makeURL", server.makeURL)
+        # Every search of the fake server finds the same populations
+        HLAfreq_snapshot.build_snapshot(
+            str(tmp_path),
+            loci=["A"],
+            countries=["Uganda"],
+            tags={"ethnic": ["Caucasian", "Black"]},
+            workers=2,
+        )
+    df = HLAfreq_snapshot.query_snapshot(str(tmp_path), ethnic="Black")
+    assert len(df) > 0
+    assert set(df.ethnic) == {"Caucasian|Black"}
@@ -0,0 +1,153 @@
+"""Delta sync of a previous download
+
+Pages are generated from lists of rows and served by patching the download
+functions used by `HLAfreq_sync`, counting the pages downloaded.
+"""
+import pytest
+import pandas as pd
+import HLAfreq
+from HLAfreq import HLAfreq_sync
+
+PAGE_SIZE = 5
+
+ROW = (
+    "<tr><td>{line}</td><td>{allele}</td><td></td><td>{population}</td><td></td>"
+    "<td>{freq}</td><td></td><td>{size}</td><td></td><td></td><td></td><td></td></tr>"
+)
+PAGE = (
+    '<div id="divGenNavig"><table class="table10"><tr><td>Page 1 of {N}</td></tr>'
+    '</table></div><div id="divGenDetail"><table class="tblNormal"><tr><th>Line</th>'
+    "</tr>{rows}</table></div>"
+)
+
+
+def make_rows(populations):
+    return [
+        (allele, population, freq, size)
+        for population, size, alleles in populations
+        for allele, freq in alleles
+    ]
+
+
+def serve(monkeypatch, rows):
+    N = -(-len(rows) // PAGE_SIZE)
+    downloaded = []
+
+    def page_text(url, timeout=20, session=None, cache=None):
+        p = int(url.split("page=")[1]) if "page=" in url else 1
+        downloaded.append(p)
+        start = (p - 1) * PAGE_SIZE
+        html = "".join(
+            ROW.format(line=i, allele=a, population=pop, freq=f, size=s)
+            for i, (a, pop, f, s) in enumerate(rows[start: start + PAGE_SIZE], start + 1)
+        )
+        return PAGE.format(N=N, rows=html)
+
+    def page_AF(url, timeout=20, session=None, cache=None):
+        return HLAfreq.parseAF(page_text(url))
+
+    monkeypatch.setattr(HLAfreq_sync, "_getPageText", page_text)
+    monkeypatch.setattr(HLAfreq_sync, "_getPageAF", page_AF)
+    return downloaded
+
+
+def download(monkeypatch, rows):
+    serve(monkeypatch, rows)
+    N = max(1, -(-len(rows) // PAGE_SIZE))
+    pages = [
+        HLAfreq.formatAF(HLAfreq.parseAF(HLAfreq_sync._getPageText("?page=%s" % p)))
+        for p in range(1, N + 1)
+    ]
+    return pd.concat(pages)
+
+
+def populations(n, prefix="pop"):
+    return [
+        ("%s%s" % (prefix, i), 100 + i, [("A*0%s:01" % j, "0.%s" % j) for j in range(1, 4)])
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        "none",
+        "insert_middle",
+        "insert_start",
+        "append",
+        "remove_middle",
+        "remove_end",
+        "insert_and_remove",
+    ],
+)
+@pytest.mark.parametrize("full", [False, True])
+def test_sync_matches_full_download(monkeypatch, change, full):
+    old = populations(40)
+    new = list(old)
+    if change == "insert_middle":
+        new.insert(20, ("new", 50, [("A*02:05", "0.5"), ("A*03:01", "0.5")]))
+    elif change == "insert_start":
+        new.insert(0, ("new", 50, [("A*02:05", "1")]))
+    elif change == "append":
+        new += populations(2, "extra")
+    elif change == "remove_middle":
+        del new[4]
+    elif change == "remove_end":
+        del new[-1]
+    elif change == "insert_and_remove":
+        # Same number of rows added and removed, no net shift
+        del new[10]
+        new.insert(1, ("new", 50, [("A*02:05", "0.2"), ("A*03:01", "0.3"), ("A*04:01", "0.5")]))
+    stored = download(monkeypatch, make_rows(old))
+    expected = download(monkeypatch, make_rows(new))
+    downloaded = serve(monkeypatch, make_rows(new))
+    updated, changes = HLAfreq_sync.syncAFdata("?", stored, full=full)
+    pd.testing.assert_frame_equal(updated, expected)
+    expected_changes = set(HLAfreq_sync.compare_populations(stored, expected).population)
+    assert set(changes.population) == expected_changes
+    N = -(-len(make_rows(new)) // PAGE_SIZE)
+    # Each page is downloaded at most once
+    assert len(downloaded) == len(set(downloaded))
+    if full:
+        assert sorted(downloaded) == list(range(1, N + 1))
+    elif change == "none":
+        # Only the first and last pages
+        assert sorted(downloaded) == [1, N]
+    else:
+        assert len(downloaded) <= N // 2
+
+
+def test_sync_missed_without_full(monkeypatch):
+    old = populations(40)
+    new = list(old)
+    # Changes in the middle that cancel out, first and last pages unchanged
+    del new[10]
+    new.insert(20, ("new", 50, [("A*02:05", "0.2"), ("A*03:01", "0.3"), ("A*04:01", "0.5")]))
+    stored = download(monkeypatch, make_rows(old))
+    expected = download(monkeypatch, make_rows(new))
+    serve(monkeypatch, make_rows(new))
+    updated, changes = HLAfreq_sync.syncAFdata("?", stored)
+    pd.testing.assert_frame_equal(updated, stored)
+    assert changes.empty
+    serve(monkeypatch, make_rows(new))
+    updated, changes = HLAfreq_sync.syncAFdata("?", stored, full=True)
+    pd.testing.assert_frame_equal(updated, expected)
+    assert set(changes.population) == {"new", "pop10"}
+
+
+def test_sync_no_results(monkeypatch):
+    stored = download(monkeypatch, make_rows(populations(3)))
+    downloaded = serve(monkeypatch, [])
+    updated, changes = HLAfreq_sync.syncAFdata("?", stored)
+    assert updated.empty
+    assert downloaded == [1]
+    assert set(changes.status) == {"removed"}
+
+
+def test_compare_populations(monkeypatch):
+    old = populations(3)
+    new = [old[0], (old[1][0], 999, old[1][2]), ("new", 10, [("A*01:01", "1")])]
+    stored = download(monkeypatch, make_rows(old))
+    updated = download(monkeypatch, make_rows(new))
+    changes = HLAfreq_sync.compare_populations(stored, updated).set_index("population")
+    assert changes.status.to_dict() == {"new": "added", "pop2": "removed", "pop1": "changed"}
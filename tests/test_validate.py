@@ -0,0 +1,68 @@
+"""Single pass validation of allele frequency data"""
+import pandas as pd
+import pytest
+import HLAfreq
+from HLAfreq import HLAfreq_validate
+
+aftab = pd.DataFrame(
+    {
+        "allele": ["A*01:01", "A*01:02", "A*01:01", "A*01:02:01", "A*01:01", "A*01:01"],
+        "loci": ["A"] * 6,
+        "population": ["p1", "p1", "p2", "p2", "p3", "p3"],
+        "allele_freq": [0.5, 0.5, 0.5, 0.2, 0.5, 0.5],
+        "sample_size": [10, 10, 20, 20, 5, 5],
+    }
+)
+
+
+def test_report_matches_checks():
+    report = HLAfreq_validate.validate(aftab, cache=False)
+    assert report.single_locus
+    assert not report.unique
+    assert list(report.duplicated.index) == [("p3", "A*01:01")]
+    pd.testing.assert_series_equal(
+        report.incomplete, HLAfreq.incomplete_studies(aftab, quiet=True)
+    )
+    assert report.resolutions.to_dict() == {2: 5, 3: 1}
+    with pytest.raises(AssertionError, match="multiple times"):
+        report.check()
+    with pytest.raises(AssertionError, match="sum to 1"):
+        report.check(unique=False)
+    with pytest.raises(AssertionError, match="multiple resolutions"):
+        report.check(unique=False, complete=False)
+
+
+def test_cached():
+    df = aftab.copy()
+    report = HLAfreq_validate.validate(df, cache=True)
+    assert HLAfreq_validate.validate(df, cache=True) is report
+    # Not cached by default
+    assert HLAfreq_validate.validate(df) is not report
+    # Frames derived from a validated frame are validated again
+    assert HLAfreq_validate.validate(df[df.population != "p3"], cache=True) is not report
+    assert HLAfreq_validate.validate(df.copy(), cache=True) is not report
+    df.loc[0, "allele_freq"] = 0.1
+    report = HLAfreq_validate.validate(df, cache=True)
+    assert report is not HLAfreq_validate.validate(df.copy(), cache=True)
+    # Names edited in place
+    df.loc[0, "allele"] = "A*01:01:01"
+    edited = HLAfreq_validate.validate(df, cache=True)
+    assert edited is not report
+    assert not edited.single_resolution
+
+
+def test_cache_not_saved(tmp_path):
+    pytest.importorskip("pyarrow")
+    df = aftab.copy()
+    HLAfreq_validate.validate(df, cache=True)
+    assert df.attrs == {}
+    df.to_parquet(tmp_path / "aftab.parquet")
+
+
+def test_combine_after_edit_in_place():
+    df = aftab[aftab.population == "p1"].copy()
+    HLAfreq.combineAF(df)
+    HLAfreq_validate.validate(df, cache=True)
+    df.loc[df.index[0], "allele"] = "A*01:01:01"
+    with pytest.raises(AssertionError, match="multiple resolutions"):
+        HLAfreq.combineAF(df)